@@ -0,0 +1,596 @@
+import io
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # FLAC/Opus encoding is optional
+    soundfile = None
+
+# Upload encodings: file extension, mimetype and soundfile format/subtype
+ENCODINGS = {
+    'wav': ('wav', 'audio/wav', None, None),
+    'flac': ('flac', 'audio/flac', 'FLAC', 'PCM_16'),
+    'opus': ('ogg', 'audio/ogg', 'OGG', 'OPUS'),
+}
+
+
+def make_buffer(max_resident_bytes=None):
+    """In-memory file for a recording.
+
+    With a limit it spills to a temporary file once the recording grows past
+    max_resident_bytes, so long dictations don't grow memory without bound.
+    """
+    if max_resident_bytes:
+        return tempfile.SpooledTemporaryFile(max_size=max_resident_bytes, prefix='voicetyper-')
+    return io.BytesIO()
+
+
+def buffer_size(buffer):
+    position = buffer.tell()
+    size = buffer.seek(0, io.SEEK_END)
+    buffer.seek(position)
+    return size
+
+
+class WavBuffer:
+    """Writes a WAV file into memory chunk by chunk while recording.
+
+    Frames are appended to a single buffer as they are captured, so the
+    recording is never joined or copied before it is uploaded.
+    """
+
+    def __init__(self, channels, sample_width, rate, buffer=None):
+        self.buffer = buffer if buffer is not None else io.BytesIO()
+        self.wav = wave.open(self.buffer, 'wb')
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(sample_width)
+        self.wav.setframerate(rate)
+
+    def write(self, data):
+        # writeframesraw skips the header update, it is patched once in close()
+        self.wav.writeframesraw(data)
+
+    def close(self):
+        """Finalizes the WAV header and returns the buffer rewound for reading."""
+        self.wav.close()
+        self.buffer.seek(0)
+        return self.buffer
+
+
+def save_recording(buffer, directory='recordings', extension='wav'):
+    """Saves an in-memory recording to disk, used by the "keep recordings" option."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{extension}")
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(buffer, f)
+    buffer.seek(0)
+    return path
+
+
+class PcmConverter:
+    """Downmixes and resamples captured int16 PCM chunk by chunk.
+
+    All work is vectorized with NumPy; the filter and interpolation state is
+    carried between chunks so chunk boundaries do not produce clicks.
+    """
+
+    def __init__(self, in_channels, in_rate, out_rate=16000, taps=31):
+        self.in_channels = in_channels
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.step = in_rate / out_rate
+        self.position = 0.0
+        self.tail = np.zeros(0, dtype=np.float32)
+        if out_rate < in_rate:
+            # Windowed-sinc low-pass at the output Nyquist frequency against aliasing
+            cutoff = out_rate / in_rate / 2
+            n = np.arange(taps) - (taps - 1) / 2
+            self.taps = (2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)).astype(np.float32)
+            self.history = np.zeros(taps - 1, dtype=np.float32)
+        else:
+            self.taps = None
+
+    def convert(self, data):
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.in_channels > 1:
+            samples = samples.reshape(-1, self.in_channels).mean(axis=1, dtype=np.float32)
+        if self.in_rate == self.out_rate:
+            return samples.astype(np.int16, copy=False)
+
+        samples = samples.astype(np.float32, copy=False)
+        if self.taps is not None:
+            padded = np.concatenate((self.history, samples))
+            self.history = padded[-(len(self.taps) - 1):]
+            samples = np.convolve(padded, self.taps, mode='valid')
+
+        # Linear interpolation, the last input sample of the previous chunk is kept
+        # so that output positions can fall between two chunks
+        x = np.concatenate((self.tail, samples))
+        if len(x) < 2:
+            self.tail = x
+            return np.zeros(0, dtype=np.int16)
+        positions = np.arange(self.position, len(x) - 1, self.step)
+        out = np.interp(positions, np.arange(len(x)), x)
+        next_position = positions[-1] + self.step if len(positions) else self.position
+        self.position = next_position - (len(x) - 1)
+        self.tail = x[-1:]
+        return np.clip(np.round(out), -32768, 32767).astype(np.int16)
+
+
+class AudioEncoder:
+    """Converts captured PCM to the upload format and encodes it into memory.
+
+    With encoding=None the samples are only converted, which is what the
+    streaming mode needs. A converter can be shared between encoders when a
+    recording is split into several segments.
+    """
+
+    def __init__(self, capture_channels, capture_rate, sample_rate=16000, encoding='wav', converter=None,
+                 max_resident_bytes=None):
+        if encoding is not None and encoding not in ENCODINGS:
+            raise ValueError(f"Unknown audio encoding: {encoding}")
+        if encoding in ('flac', 'opus') and soundfile is None:
+            print(f"soundfile is not installed, {encoding} encoding falls back to wav")
+            encoding = 'wav'
+        self.encoding = encoding
+        self.extension, self.mimetype, sf_format, sf_subtype = ENCODINGS.get(encoding, (None, None, None, None))
+        self.sample_rate = sample_rate
+        self.converter = converter or PcmConverter(capture_channels, capture_rate, sample_rate)
+        self.bytes_in = 0
+        self.samples = 0  # Samples written at sample_rate, for the audio duration
+
+        self.wav = None
+        self.sound = None
+        self.buffer = None
+        if encoding == 'wav':
+            self.wav = WavBuffer(1, 2, sample_rate, make_buffer(max_resident_bytes))
+            self.buffer = self.wav.buffer
+        elif encoding:
+            self.buffer = make_buffer(max_resident_bytes)
+            self.sound = soundfile.SoundFile(
+                self.buffer, 'w', samplerate=sample_rate, channels=1,
+                format=sf_format, subtype=sf_subtype
+            )
+
+    def write(self, data):
+        """Encodes a captured chunk and returns the converted samples."""
+        self.bytes_in += len(data)
+        return self.write_samples(self.converter.convert(data))
+
+    def write_samples(self, samples):
+        """Encodes samples that were already converted to the output format."""
+        self.samples += len(samples)
+        if self.wav:
+            self.wav.write(samples.tobytes())
+        elif self.sound and len(samples):
+            self.sound.write(samples)
+        return samples
+
+    @property
+    def duration(self):
+        return self.samples / self.sample_rate
+
+    def close(self):
+        """Finishes the stream and returns the encoded buffer rewound for reading."""
+        if self.wav:
+            return self.wav.close()
+        if not self.sound:
+            return None
+        self.sound.close()
+        self.buffer.seek(0)
+        return self.buffer
+
+
+class VoiceActivityDetector:
+    """Energy and zero-crossing rate voice activity detection.
+
+    Works on 16-bit mono PCM in fixed frames; all frames of a chunk are
+    measured at once with NumPy. The noise floor adapts to the room, so the
+    threshold is relative to the background level.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, margin_db=12, min_speech_db=-50, zcr_threshold=0.25):
+        self.frame_length = sample_rate * frame_ms // 1000
+        self.frame_ms = frame_ms
+        self.margin_db = margin_db
+        self.min_speech_db = min_speech_db
+        self.zcr_threshold = zcr_threshold
+        self.noise_db = None
+        self.remainder = np.zeros(0, dtype=np.int16)
+
+    def frames(self, samples):
+        """Splits samples into whole frames, the rest is kept for the next call."""
+        samples = np.concatenate((self.remainder, samples))
+        count = len(samples) // self.frame_length
+        self.remainder = samples[count * self.frame_length:]
+        return samples[:count * self.frame_length].reshape(count, self.frame_length)
+
+    def classify(self, frames):
+        """Returns a boolean speech flag for every frame."""
+        if not len(frames):
+            return np.zeros(0, dtype=bool)
+        x = frames.astype(np.float32) / 32768
+        energy_db = 10 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+        zcr = np.mean(np.signbit(x[:, 1:]) != np.signbit(x[:, :-1]), axis=1)
+
+        if self.noise_db is None:
+            self.noise_db = float(np.min(energy_db))
+        threshold = max(self.noise_db + self.margin_db, self.min_speech_db)
+        # Loud frames are speech; quieter frames with many zero crossings are fricatives
+        speech = (energy_db > threshold) | ((energy_db > threshold - self.margin_db / 2) & (zcr > self.zcr_threshold))
+
+        # Track the noise floor on silent frames, fast downwards and slow upwards
+        for level in energy_db[~speech]:
+            rate = 0.5 if level < self.noise_db else 0.02
+            self.noise_db += rate * (level - self.noise_db)
+        return speech
+
+
+class SpeechSegmenter:
+    """Trims silence and splits a recording at pauses.
+
+    process() turns a stream of samples into events: ('start', None) when
+    speech begins, ('audio', samples) for audio to keep and ('end', None)
+    after a pause of split_ms. Silence outside the padding is never emitted.
+    """
+
+    def __init__(self, sample_rate=16000, split_ms=700, padding_ms=200, vad=None):
+        self.vad = vad or VoiceActivityDetector(sample_rate)
+        frame_ms = self.vad.frame_ms
+        self.split_frames = max(1, split_ms // frame_ms) if split_ms else None
+        self.padding_frames = max(1, padding_ms // frame_ms)
+        self.frame_ms = frame_ms
+        self.leading = deque(maxlen=self.padding_frames)  # Silence before speech starts
+        self.trailing = []  # Silence inside a segment, kept until speech resumes
+        self.in_segment = False
+        self.heard_speech = False
+        self.silent_frames = 0
+        self.total_frames = 0
+        self.kept_frames = 0
+
+    @property
+    def silence_ms(self):
+        """Silence since the last speech, 0 until anything was said."""
+        return self.silent_frames * self.frame_ms if self.heard_speech else 0
+
+    @property
+    def removed_ms(self):
+        return (self.total_frames - self.kept_frames) * self.frame_ms
+
+    def _keep(self, frames):
+        self.kept_frames += len(frames)
+        return ('audio', np.concatenate(frames))
+
+    def process(self, samples):
+        events = []
+        frames = self.vad.frames(samples)
+        self.total_frames += len(frames)
+        for frame, speech in zip(frames, self.vad.classify(frames)):
+            if speech:
+                self.heard_speech = True
+                self.silent_frames = 0
+                if not self.in_segment:
+                    self.in_segment = True
+                    events.append(('start', None))
+                    self.leading.append(frame)
+                    events.append(self._keep(list(self.leading)))
+                    self.leading.clear()
+                else:
+                    self.trailing.append(frame)
+                    events.append(self._keep(self.trailing))
+                    self.trailing = []
+                continue
+
+            self.silent_frames += 1
+            if not self.in_segment:
+                self.leading.append(frame)
+                continue
+            self.trailing.append(frame)
+            if self.split_frames and len(self.trailing) >= self.split_frames:
+                events.extend(self._end_segment())
+        return events
+
+    def _end_segment(self):
+        events = []
+        if self.trailing:
+            events.append(self._keep(self.trailing[:self.padding_frames]))
+        # The tail of the pause may be the padding of the next segment
+        self.leading.extend(self.trailing[-self.padding_frames:])
+        self.trailing = []
+        self.in_segment = False
+        events.append(('end', None))
+        return events
+
+    def flush(self):
+        """Ends the open segment when the recording stops."""
+        return self._end_segment() if self.in_segment else []
+
+
+class CaptureSession:
+    """Audio chunks of one recording, handed from the capture thread to the recorder."""
+
+    def __init__(self, chunks=()):
+        self.chunks = queue.Queue()
+        for data in chunks:
+            self.chunks.put(data)
+        self.stopped = threading.Event()
+        # time.perf_counter() of the first chunk read after begin() and of stop()
+        self.first_audio_at = None
+        self.stopped_at = None
+
+    def put(self, data):
+        if self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+        self.chunks.put(data)
+
+    def stop(self):
+        if not self.stopped.is_set():
+            self.stopped_at = time.perf_counter()
+            self.stopped.set()
+            self.chunks.put(None)
+
+    def __iter__(self):
+        # Yields chunks until stop() was called and everything before it was read
+        while True:
+            data = self.chunks.get()
+            if data is None:
+                return
+            yield data
+
+
+class AudioRing:
+    """Fixed-size ring of audio chunks between one producer and one consumer.
+
+    put() runs in the PortAudio callback and drain() on the dispatcher
+    thread. Each side only moves its own counter and storing a list item or
+    an attribute is atomic in CPython, so neither side takes a lock. When the
+    consumer is a whole ring behind, put() drops the chunk and counts it
+    rather than holding up the audio thread.
+    """
+
+    def __init__(self, slots):
+        self.slots = [None] * slots
+        self.size = slots
+        self.written = 0
+        self.read = 0
+        self.dropped = 0
+
+    def __len__(self):
+        # Chunks written but not drained yet, exact only on the consumer side
+        return self.written - self.read
+
+    def put(self, data):
+        if self.written - self.read >= self.size:
+            self.dropped += 1
+            return False
+        self.slots[self.written % self.size] = data
+        self.written += 1  # Publishes the slot, so after the store
+        return True
+
+    def drain(self):
+        chunks = []
+        while self.read < self.written:
+            index = self.read % self.size
+            chunks.append(self.slots[index])
+            self.slots[index] = None
+            self.read += 1
+        return chunks
+
+
+class CaptureEngine:
+    """Keeps the microphone stream open between recordings.
+
+    The stream runs in PortAudio's callback mode: the callback only puts the
+    chunk into an AudioRing, a dispatcher thread hands chunks to the current
+    session or, between recordings, keeps the last pre_roll_ms of audio, so
+    a recording also contains what was said just before the hotkey press. A
+    busy GUI or typing loop delays the dispatcher, not the device; audio is
+    only lost when the dispatcher is ring_ms behind, and then it is counted.
+    Between recordings nothing waits for the audio, so the dispatcher only
+    wakes every idle_interval seconds, begin() wakes it right away.
+    With persistent=False the device is opened by open() before a recording
+    and closed by end() instead.
+    """
+
+    def __init__(self, channels=1, rate=44100, chunk=1024, pre_roll_ms=300, persistent=True, pyaudio_module=None,
+                 ring_ms=2000):
+        self.channels = channels
+        self.rate = rate
+        self.chunk = chunk
+        self.persistent = persistent
+        self.pyaudio_module = pyaudio_module
+        self.preroll = self._preroll_buffer(pre_roll_ms)
+        self.ring = AudioRing(max(2, math.ceil(ring_ms * rate / 1000 / chunk)))
+        self.poll_interval = chunk / rate / 2
+        # A quarter of the ring, so idling can't make it overflow
+        self.idle_interval = max(self.poll_interval, min(0.1, self.ring.size * chunk / rate / 4))
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.device_lock = threading.Lock()  # Serializes opening and closing the stream
+        self.session = None
+        self.pa = None
+        self.stream = None
+        self.thread = None
+        self.running = False
+        # Written by the callback only
+        self.frames = 0
+        self.overflows = 0
+
+    def _preroll_buffer(self, pre_roll_ms):
+        return deque(maxlen=max(1, math.ceil(pre_roll_ms * self.rate / 1000 / self.chunk)) if pre_roll_ms else 0)
+
+    def set_pre_roll(self, pre_roll_ms):
+        """Changes the pre-roll length without reopening the device."""
+        with self.lock:
+            self.preroll = deque(self.preroll, self._preroll_buffer(pre_roll_ms).maxlen)
+
+    def stats(self):
+        """Frames delivered by the device, input overflows it reported and frames dropped by the ring."""
+        return {'frames': self.frames, 'overflows': self.overflows, 'dropped_frames': self.ring.dropped * self.chunk}
+
+    def open(self):
+        with self.device_lock:
+            self._open()
+
+    def _open(self):
+        if self.stream is not None:
+            return
+        pyaudio = self.pyaudio_module
+        if pyaudio is None:
+            import pyaudio
+        self.overflow_flag = pyaudio.paInputOverflow
+        self.continue_flag = pyaudio.paContinue
+        self.running = True
+        self.thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.thread.start()
+        self.pa = pyaudio.PyAudio()
+        try:
+            self.stream = self.pa.open(
+                format=pyaudio.paInt16,
+                channels=self.channels,
+                rate=self.rate,
+                frames_per_buffer=self.chunk,
+                input=True,
+                stream_callback=self._callback
+            )
+        except Exception:
+            self.pa.terminate()
+            self.pa = None
+            self._stop_dispatcher()
+            raise
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Runs on PortAudio's thread, must not block
+        self.frames += frame_count
+        if status & self.overflow_flag:
+            self.overflows += 1
+        self.ring.put(in_data)
+        return None, self.continue_flag
+
+    def _dispatch_loop(self):
+        while True:
+            running = self.running
+            chunks = self.ring.drain()
+            if chunks:
+                with self.lock:
+                    for data in chunks:
+                        if self.session is not None and not self.session.stopped.is_set():
+                            self.session.put(data)
+                        else:
+                            self.preroll.append(data)
+            elif not running:
+                break  # The stream is closed and everything it delivered was handed on
+            elif self.session is None:
+                self.wake.wait(self.idle_interval)
+                self.wake.clear()  # session is checked again before the next wait
+            else:
+                time.sleep(self.poll_interval)
+
+    def _stop_dispatcher(self):
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def begin(self):
+        """Starts a recording, the returned session already holds the pre-roll.
+
+        Only swaps in the new session, the device has to be opened already.
+        """
+        with self.lock:
+            # Chunks still in the ring follow the pre-roll, drop as many of its oldest ones
+            excess = len(self.preroll) + len(self.ring) - self.preroll.maxlen
+            self.session = CaptureSession(list(self.preroll)[max(0, excess):])
+            self.preroll.clear()
+        self.wake.set()
+        return self.session
+
+    def end(self, session):
+        with self.lock:
+            if self.session is session:
+                self.session = None
+        session.stop()
+        if not self.persistent:
+            with self.device_lock:
+                # A quick re-press may have begun the next recording already, it keeps the device.
+                # If it begins right after this check, its open() waits here and opens it again
+                with self.lock:
+                    idle = self.session is None
+                if idle:
+                    self._close()
+
+    def close(self):
+        with self.device_lock:
+            self._close()
+
+    def _close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+        self._stop_dispatcher()
+        with self.lock:
+            self.preroll.clear()  # Stale by the time the device is opened again
+
+
+class ChimePlayer:
+    """Plays the start/stop sounds without blocking the caller.
+
+    The WAV files are decoded once at startup and played from memory on a
+    background thread.
+    """
+
+    def __init__(self, sounds, pyaudio_module=None):
+        self.pyaudio_module = pyaudio_module
+        self.sounds = {}
+        for name, path in sounds.items():
+            with wave.open(path, 'rb') as wf:
+                self.sounds[name] = (wf.getsampwidth(), wf.getnchannels(), wf.getframerate(),
+                                     wf.readframes(wf.getnframes()))
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def play(self, name):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.queue.put(name)
+
+    def _run(self):
+        pyaudio = self.pyaudio_module
+        if pyaudio is None:
+            import pyaudio
+        pa = pyaudio.PyAudio()
+        while True:
+            name = self.queue.get()
+            if name is None:
+                break
+            sample_width, channels, rate, frames = self.sounds[name]
+            try:
+                stream = pa.open(format=pa.get_format_from_width(sample_width), channels=channels,
+                                 rate=rate, output=True)
+                stream.write(frames)
+                stream.stop_stream()
+                stream.close()
+            except Exception as e:
+                print(f"Can't play {name} sound: {str(e)}")
+        pa.terminate()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
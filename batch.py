@@ -0,0 +1,175 @@
+"""Transcribes folders of recordings without the GUI.
+
+Uses the recognizer configured in settings.json and writes one JSON line per
+file with its transcript (or error) and timing. Files that are already in the
+output file with a transcript are skipped, so an interrupted run resumes.
+
+    python batch.py recordings/ --output transcripts.jsonl
+    python batch.py "backlog/**/*.wav" --workers 8 --rate 5 --output transcripts.jsonl
+    python batch.py recordings/ --backend fake  # no network, e.g. in CI
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+from config import Settings
+from recognizers import DEFAULT_PROFILE, PRERECORDED_OPTIONS, create_profiles
+
+MIMETYPES = {
+    '.wav': 'audio/wav',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.webm': 'audio/webm',
+}
+
+
+def find_files(inputs):
+    """Expands directories and glob patterns into a sorted list of audio files."""
+    files = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files.update(os.path.join(root, name) for name in names)
+        else:
+            files.update(glob.glob(pattern, recursive=True))
+    return sorted(path for path in files if os.path.splitext(path)[1].lower() in MIMETYPES)
+
+
+def load_done(path):
+    """Files that already have a transcript in an earlier output file."""
+    done = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:  # Last line of a run that was killed mid-write
+                continue
+            if result.get('error') is None:
+                done.add(result['file'])
+    return done
+
+
+def open_output(path):
+    if not path:
+        return sys.stdout
+    f = open(path, 'a+', encoding='utf-8')
+    # Start on a fresh line if the previous run stopped halfway through one
+    if f.tell() > 0:
+        f.seek(f.tell() - 1)
+        if f.read(1) != '\n':
+            f.write('\n')
+    return f
+
+
+class RateLimiter:
+    """Spaces the start of requests at least 1/rate seconds apart."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_start = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+async def transcribe_file(recognizer, path, options=PRERECORDED_OPTIONS):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    result = {'file': path, 'transcript': None, 'error': None}
+    try:
+        data = await loop.run_in_executor(None, read_file, path)
+        result['bytes'] = len(data)
+        mimetype = MIMETYPES[os.path.splitext(path)[1].lower()]
+        result['transcript'] = await recognizer.transcribe(io.BytesIO(data), mimetype, dict(options))
+    except Exception as e:
+        result['error'] = str(e) or type(e).__name__
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def run(files, recognizer, output, workers=4, rate=None, options=PRERECORDED_OPTIONS):
+    """Transcribes files with up to workers requests in flight, writing results as they finish."""
+    pending = asyncio.Queue()
+    for path in files:
+        pending.put_nowait(path)
+    limiter = RateLimiter(rate)
+    counts = {'done': 0, 'failed': 0}
+
+    async def worker():
+        while not pending.empty():
+            path = pending.get_nowait()
+            await limiter.wait()
+            result = await transcribe_file(recognizer, path, options)
+            counts['failed' if result['error'] else 'done'] += 1
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    await recognizer.close()
+    return counts
+
+
+def load_settings(path, args):
+    settings = Settings(path, create=False).snapshot()
+    if args.backend:
+        settings['backend'] = args.backend
+    if os.environ.get('DEEPGRAM_API_KEY'):
+        settings['api_key'] = os.environ['DEEPGRAM_API_KEY']
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='directories or glob patterns of audio files')
+    parser.add_argument('--output', help='JSONL file to append results to (default: stdout, no resume)')
+    parser.add_argument('--settings', default='settings.json')
+    parser.add_argument('--backend', help='override the recognizer backend, e.g. fake')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, help='recognition profile from the settings')
+    parser.add_argument('--workers', type=int, default=4, help='requests in flight at the same time')
+    parser.add_argument('--rate', type=float, help='maximum requests started per second')
+    parser.add_argument('--no-resume', action='store_true', help='transcribe files again even if they are in the output')
+    args = parser.parse_args()
+
+    files = find_files(args.inputs)
+    done = set() if args.no_resume else load_done(args.output)
+    todo = [path for path in files if path not in done]
+    print(f"{len(files)} files, {len(files) - len(todo)} already transcribed", file=sys.stderr)
+
+    profiles = create_profiles(load_settings(args.settings, args))
+    if args.profile not in profiles:
+        parser.error(f"unknown profile {args.profile}, the settings have {', '.join(profiles)}")
+    profile = profiles[args.profile]
+    output = open_output(args.output)
+    start = time.perf_counter()
+    try:
+        counts = asyncio.run(run(todo, profile.recognizer, output, args.workers, args.rate, profile.options))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"{counts['done']} transcribed, {counts['failed']} failed in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
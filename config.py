@@ -0,0 +1,247 @@
+import json
+import os
+import tempfile
+import threading
+
+from output import TYPING_MODES
+
+NUMBER = (int, float)
+OPTIONAL_STR = (str, type(None))
+
+# key: (allowed types, default, allowed values or None)
+# The encodings and backends mirror audio.ENCODINGS and recognizers.BACKENDS,
+# importing those modules here would load numpy and asyncio at startup.
+SCHEMA = {
+    'api_key': (str, '', None),
+    'api_url': (OPTIONAL_STR, None, None),
+    'shortcut': (str, 'f2', ('f2', 'alt+f2', 'ctrl+f12', 'alt+f12')),
+    'cancel_shortcut': (str, '<esc>', None),
+    'backend': (str, 'deepgram', ('deepgram', 'whisper', 'fake')),
+    'whisper_model': (str, 'base', None),
+    'whisper_device': (str, 'cpu', None),
+    'whisper_compute_type': (str, 'int8', None),
+    'fake_transcript': (str, 'This is a fake transcript.', None),
+    'fake_latency': (NUMBER, 0.0, None),
+    'streaming': (bool, False, None),
+    'interim_typing': (bool, False, None),
+    'interim_holdback_words': (int, 0, None),
+    'keep_recordings': (bool, False, None),
+    'encoding': (str, 'wav', ('wav', 'flac', 'opus')),
+    'capture_channels': (int, 1, None),
+    'capture_rate': (int, 44100, None),
+    'sample_rate': (int, 16000, None),
+    'persistent_capture': (bool, True, None),
+    'pre_roll_ms': (NUMBER, 300, None),
+    'max_buffer_mb': (NUMBER, 32, None),
+    'vad': (bool, False, None),
+    'vad_split_ms': (NUMBER, 700, None),
+    'auto_stop_ms': (NUMBER, 0, None),
+    'typing_mode': (str, 'chunked', TYPING_MODES),
+    'rules_file': (str, 'rules.json', None),
+    'max_pending_jobs': (int, 8, None),
+    'max_concurrent_uploads': (int, 3, None),
+    'request_timeout': (NUMBER, 30.0, None),
+    'max_retries': (int, 3, None),
+    'retry_backoff': (NUMBER, 0.5, None),
+    'hedge_after': (NUMBER, 0, None),
+    'spool_dir': (str, 'spool', None),
+    'spool_all': (bool, False, None),
+    'cache_entries': (int, 128, None),
+    'cache_file': (OPTIONAL_STR, None, None),
+    'cache_disk_entries': (int, 10000, None),
+    'metrics_samples': (int, 500, None),
+    'metrics_file': (OPTIONAL_STR, None, None),
+    'history_db': (str, 'history.db', None),
+    'log_max_kb': (NUMBER, 1024, None),
+    'log_max_days': (NUMBER, 30, None),
+    'log_backups': (int, 5, None),
+    'log_view_entries': (int, 100, None),
+    'ui_fps': (NUMBER, 30, None),
+    'close_to_tray': (bool, False, None),
+    'start_in_tray': (bool, False, None),
+    'profiles': (dict, {}, None),
+}
+
+
+class SettingsError(ValueError):
+    pass
+
+
+def validate(values):
+    """Returns the values that match SCHEMA and a list of problems with the others.
+
+    Keys the schema doesn't know are kept as they are.
+    """
+    valid, problems = {}, []
+    for key, value in values.items():
+        if key not in SCHEMA:
+            valid[key] = value
+            continue
+        types, _, choices = SCHEMA[key]
+        # bool is an int subclass, don't let true pass as a number
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            expected = ' or '.join(t.__name__ for t in types) if isinstance(types, tuple) else types.__name__
+            problems.append(f"{key}: expected {expected}, got {value!r}")
+        elif choices is not None and value not in choices:
+            problems.append(f"{key}: {value!r} is not one of {', '.join(choices)}")
+        else:
+            valid[key] = value
+    return valid, problems
+
+
+class Settings:
+    """The one place settings.json is read and written.
+
+    The file is read once and cached, get() never touches the disk and falls
+    back to the SCHEMA default. update() validates the changes against
+    SCHEMA, writes the file atomically (temp file + rename) and tells every
+    subscriber which keys changed. Entries that failed validation stay in
+    the file as they were. While the file can't be parsed it is never
+    written, so a typo can't cost the user their settings. With
+    watch() a background thread polls the file and picks up edits made by
+    hand the same way. Subscribers are called on the thread that made the
+    change.
+    """
+
+    def __init__(self, path='settings.json', defaults=None, create=True):
+        # Resolved once, a later chdir doesn't move the settings
+        self.path = os.path.abspath(path)
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.values = {}
+        self.raw = {}  # Everything in the file, including entries that failed validation
+        self.error = None  # Why the file couldn't be parsed, nothing is saved until it can
+        self.signature = None
+        self.watcher = None
+        self.stopped = threading.Event()
+        try:
+            self.raw, self.values = self._read()
+        except FileNotFoundError:
+            self.values = dict(defaults or {})
+            self.raw = dict(self.values)
+            if create:
+                self._write(self.raw)
+        except ValueError as e:
+            self.values = dict(defaults or {})
+            self.error = f"Can't read {os.path.basename(self.path)}, using defaults until it is fixed: {str(e)}"
+            print(self.error)
+
+    def _read(self):
+        """Returns everything in the file and the entries of it that are valid."""
+        signature = self._stat()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict):
+            raise ValueError("expected a JSON object")
+        self.signature = signature
+        valid, problems = validate(raw)
+        for problem in problems:
+            print(f"Ignoring invalid setting {problem}")
+        return raw, valid
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _write(self, values):
+        directory = os.path.dirname(self.path)
+        fd, temporary = tempfile.mkstemp(prefix='.settings-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(values, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        # Our own write must not look like an outside edit to the watcher
+        self.signature = self._stat()
+
+    def get(self, key, default=None):
+        if key in self.values:
+            return self.values[key]
+        if key in SCHEMA:
+            default = SCHEMA[key][1]
+            # Copied, a caller changing it must not change the default
+            return default.copy() if isinstance(default, (dict, list)) else default
+        return default
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def keys(self):
+        return self.values.keys()
+
+    def snapshot(self):
+        return dict(self.values)
+
+    def subscribe(self, callback):
+        """callback(changed_keys) runs after every change of the settings."""
+        self.subscribers.append(callback)
+
+    def update(self, changes):
+        """Validates, saves and publishes changes, raises SettingsError if one is invalid."""
+        valid, problems = validate(changes)
+        if problems:
+            raise SettingsError('; '.join(problems))
+        with self.lock:
+            if self.error:
+                raise SettingsError(self.error)
+            values = dict(self.values)
+            values.update(valid)
+            changed = {key for key in valid if self.values.get(key) != valid[key]}
+            if not changed:
+                return changed
+            raw = dict(self.raw)
+            raw.update(valid)
+            self._write(raw)
+            # Replaced, not mutated, so readers never see a half applied change
+            self.raw = raw
+            self.values = values
+        self._notify(changed)
+        return changed
+
+    def _notify(self, changed):
+        for callback in self.subscribers:
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"Settings subscriber failed: {str(e)}")
+
+    def watch(self, interval=1.0):
+        """Starts polling the file for changes made outside the app, again after stop()."""
+        if self.watcher is not None:
+            return
+        # Every watcher has its own event, one that is still sleeping can't be revived by a new watch()
+        self.stopped = threading.Event()
+        self.watcher = threading.Thread(target=self._watch, args=(interval, self.stopped), daemon=True)
+        self.watcher.start()
+
+    def _watch(self, interval, stopped):
+        while not stopped.wait(interval):
+            signature = self._stat()
+            if signature is None or signature == self.signature:
+                continue
+            with self.lock:
+                try:
+                    self.raw, values = self._read()
+                except (OSError, ValueError):
+                    continue  # Probably saved halfway, try again on the next tick
+                if self.error:
+                    print(f"{os.path.basename(self.path)} can be read again")
+                    self.error = None
+                changed = {key for key in set(values) | set(self.values) if values.get(key) != self.values.get(key)}
+                self.values = values
+            if changed:
+                self._notify(changed)
+
+    def stop(self):
+        self.stopped.set()
+        self.watcher = None
@@ -0,0 +1,192 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+_CLEAR = object()  # Writer command, see TranscriptHistory.clear()
+
+
+def fts_query(text):
+    """Turns what the user typed into an FTS5 query: all words, the last one as a prefix."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class TranscriptHistory:
+    """Transcript log with a background writer and full-text search.
+
+    add() only queues the entry. A writer thread appends queued entries in
+    batches to the plain text log and to an SQLite database. The text log
+    is rotated like a RotatingFileHandler once it is larger than max_bytes
+    or older than max_age_days. The database keeps everything and has an
+    FTS5 index (a LIKE scan where SQLite was built without FTS5), so
+    search() stays fast over months of dictation.
+    """
+
+    def __init__(self, log_path='transcribe.log', db_path='history.db', max_bytes=1024 * 1024, max_age_days=30,
+                 backups=5, flush_interval=1.0, batch_size=100):
+        self.log_path = log_path
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()  # Guards the reader connection
+
+        created = not os.path.exists(db_path)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Searches don't wait for the writer
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transcripts USING fts5(text, created UNINDEXED)")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.db.execute("CREATE TABLE IF NOT EXISTS transcripts (text TEXT, created REAL)")
+            self.fts = False
+        self.db.commit()
+        if created:
+            self._import_log()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _import_log(self):
+        # Carry over what was logged before the history database existed
+        entries = []
+        for path in [f"{self.log_path}.{i}" for i in range(self.backups, 0, -1)] + [self.log_path]:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        stamp, _, text = line.rstrip('\n').partition(': ')
+                        try:
+                            entries.append((text, datetime.fromisoformat(stamp).timestamp()))
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+        if entries:
+            self.db.executemany("INSERT INTO transcripts (text, created) VALUES (?, ?)", entries)
+            self.db.commit()
+
+    def add(self, text, created=None):
+        self.queue.put((text.replace('\n', ' '), time.time() if created is None else created))
+
+    def clear(self):
+        """Empties the log and the database once the entries queued before were written."""
+        self.queue.put(_CLEAR)
+
+    def flush(self, timeout=5):
+        """Waits until everything queued so far was written."""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        db = sqlite3.connect(self.db_path)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            # Collect whatever else arrives shortly after, so a burst is one write
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+                if batch[-1] is None or batch[-1] is _CLEAR:
+                    break
+
+            entries = []
+            for item in batch:
+                if isinstance(item, tuple):
+                    entries.append(item)
+                    continue
+                self._write(db, entries)
+                entries = []
+                if item is _CLEAR:
+                    self._clear(db)
+                elif isinstance(item, threading.Event):
+                    item.set()
+            self._write(db, entries)
+            if batch[-1] is None:
+                break
+        db.close()
+
+    def _write(self, db, entries):
+        if not entries:
+            return
+        try:
+            self._rotate()
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.writelines(f"{datetime.fromtimestamp(created)}: {text}\n" for text, created in entries)
+            db.executemany("INSERT INTO transcripts (text, created) VALUES (?, ?)", entries)
+            db.commit()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Failed to write the transcript history: {str(e)}")
+
+    def _rotate(self):
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return
+        if size < self.max_bytes and time.time() - self._log_started() < self.max_age:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.log_path}.{i}"):
+                os.replace(f"{self.log_path}.{i}", f"{self.log_path}.{i + 1}")
+        if self.backups:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        else:
+            os.remove(self.log_path)
+
+    def _log_started(self):
+        # Time of the first line, the file times don't tell when it was created
+        with open(self.log_path, encoding='utf-8') as f:
+            stamp = f.readline().partition(': ')[0]
+        try:
+            return datetime.fromisoformat(stamp).timestamp()
+        except ValueError:
+            return os.path.getmtime(self.log_path)
+
+    def _clear(self, db):
+        db.execute("DELETE FROM transcripts")
+        db.commit()
+        with open(self.log_path, 'w', encoding='utf-8'):
+            pass
+
+    def recent(self, limit=100):
+        """The newest entries as (created, text), newest first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT created, text FROM transcripts ORDER BY rowid DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def search(self, text, limit=100):
+        """Entries containing all the words of text, newest first."""
+        with self.lock:
+            if self.fts:
+                query = fts_query(text)
+                if not query:
+                    return []
+                return self.db.execute(
+                    "SELECT created, text FROM transcripts WHERE transcripts MATCH ? ORDER BY rowid DESC LIMIT ?",
+                    (query, limit)
+                ).fetchall()
+            where = ' AND '.join(['text LIKE ?'] * len(text.split())) or '0'
+            return self.db.execute(
+                f"SELECT created, text FROM transcripts WHERE {where} ORDER BY rowid DESC LIMIT ?",
+                [f"%{word}%" for word in text.split()] + [limit]
+            ).fetchall()
+
+    def close(self, timeout=5):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,99 @@
+import asyncio
+import concurrent.futures
+import threading
+
+from deepgram._enums import LiveTranscriptionEvent
+
+
+class LiveTranscriptionError(Exception):
+    """The live session ended before all results arrived."""
+
+
+class LiveTranscriber:
+    """Streams raw PCM chunks to a Deepgram live session while recording.
+
+    The Deepgram SDK is asyncio based, so the session runs on its own event
+    loop thread; the recording thread only calls send() and finish().
+    results and finals count the non-empty results delivered so far.
+    """
+
+    def __init__(self, deepgram, options, on_transcript, on_close=None):
+        self.deepgram = deepgram
+        self.options = options
+        self.on_transcript = on_transcript
+        self.on_close = on_close
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.socket = None
+        self.results = 0
+        self.finals = 0
+        self.completed = False  # The closing metadata arrived, nothing is missing
+
+    def start(self, timeout=10):
+        self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(self._connect(), self.loop)
+        try:
+            self.socket = future.result(timeout)
+        except Exception:
+            self._stop_loop()
+            raise
+
+    async def _connect(self):
+        socket = await self.deepgram.transcription.live(self.options)
+        socket.register_handler(LiveTranscriptionEvent.TRANSCRIPT_RECEIVED, self._handle_message)
+        if self.on_close:
+            socket.register_handler(LiveTranscriptionEvent.CLOSE, self.on_close)
+        return socket
+
+    def _handle_message(self, message):
+        # The stream ends with a metadata message, like the SDK it is recognized by its sha256
+        if 'sha256' in message:
+            self.completed = True
+        # The stream also delivers Metadata/UtteranceEnd messages, only results carry text
+        if message.get('type', 'Results') != 'Results':
+            return
+        try:
+            alternative = message['channel']['alternatives'][0]
+        except (KeyError, IndexError):
+            return
+        transcript = alternative.get('transcript', '')
+        is_final = bool(message.get('is_final'))
+        if transcript:
+            self.results += 1
+            self.finals += is_final
+        self.on_transcript(transcript, is_final)
+
+    def send(self, data):
+        # asyncio.Queue is not thread-safe, hand the chunk over to the loop thread
+        self.loop.call_soon_threadsafe(self.socket.send, data)
+
+    def finish(self, timeout=30):
+        """Flushes the stream and waits until the last final result arrived.
+
+        Raises LiveTranscriptionError if the connection was lost before that.
+        """
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.socket.finish(), self.loop)
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise LiveTranscriptionError(f"no final results after {timeout} s") from None
+        finally:
+            self._stop_loop()
+        if not self.completed:
+            raise LiveTranscriptionError("the connection closed before the last results arrived")
+
+    async def _cancel_tasks(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _stop_loop(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result(5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        if not self.loop.is_running():
+            self.loop.close()
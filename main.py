@@ -1,21 +1,22 @@
-import asyncio
-import codecs
-import json
+import gc
 import os
+import sys
 import threading
 import time
-import wave
 from datetime import datetime
 
 import customtkinter as ctk
-import pyaudio
-import pystray
-from PIL import Image
-from deepgram import Deepgram
-from deepgram.errors import DeepgramSetupError
-from playsound import playsound
 from pynput import keyboard
 
+from config import Settings, SettingsError
+from metrics import MetricsStore
+from output import TYPING_MODES, InterimTyper, TextInjector
+from uiqueue import UiQueue
+
+# numpy, PyAudio, asyncio, aiohttp, the Deepgram SDK and the tray icon are
+# imported where they are used, most of them by load_components() on a
+# background thread once the window is up (see tools/bench_startup.py)
+
 # Set theme and color scheme
 ctk.set_appearance_mode("system")
 # ctk.set_appearance_mode("dark")
@@ -23,20 +24,69 @@ ctk.set_default_color_theme("blue")
 # ctk.set_default_color_theme("dark-blue")
 
 
+class ApiKeyError(Exception):
+    """The Deepgram SDK rejected the API key."""
+
+
+# Sounds and icons, found next to main.py whatever the working directory is
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# How changed settings are applied by on_settings_changed, settings that are
+# read at the start of every recording need nothing
+CAPTURE_SETTINGS = {'capture_channels', 'capture_rate', 'persistent_capture'}
+RECOGNIZER_SETTINGS = {
+    'backend', 'api_key', 'api_url', 'whisper_model', 'whisper_device', 'whisper_compute_type',
+    'fake_transcript', 'fake_latency', 'cache_entries', 'cache_file', 'cache_disk_entries', 'profiles'
+}
+RETRY_SETTINGS = {'request_timeout', 'max_retries', 'retry_backoff', 'hedge_after'}
+RESTART_SETTINGS = {
+    'max_pending_jobs', 'max_concurrent_uploads', 'spool_dir', 'metrics_samples', 'metrics_file',
+    'history_db', 'log_max_kb', 'log_max_days', 'log_backups', 'ui_fps'
+}
+
+
+def trim_memory():
+    """Collects garbage and gives freed memory back to the OS, for the tray."""
+    gc.collect()
+    try:
+        import ctypes
+        if sys.platform == 'win32':
+            # Pages the hotkey and the capture keep using come back on their own
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetProcessWorkingSetSize(kernel32.GetCurrentProcess(), ctypes.c_size_t(-1), ctypes.c_size_t(-1))
+        elif sys.platform.startswith('linux'):
+            ctypes.CDLL('libc.so.6').malloc_trim(0)  # glibc keeps freed heap otherwise
+    except (OSError, AttributeError):
+        pass
+
+
+def create_deepgram_client(settings, api_key=None):
+    from deepgram import Deepgram
+    from deepgram.errors import DeepgramSetupError
+
+    # A custom api_url lets the app talk to a local stand-in (see tools/fake_deepgram.py)
+    api_key = settings.get('api_key', '') if api_key is None else api_key
+    try:
+        if settings.get('api_url'):
+            return Deepgram({'api_key': api_key, 'api_url': settings['api_url']})
+        return Deepgram(api_key)
+    except DeepgramSetupError as e:
+        raise ApiKeyError(str(e)) from e
+
+
 class SettingsDialog:
-    def __init__(self, parent, callback=None):
+    def __init__(self, parent, settings):
+        from audio import ENCODINGS
+        from recognizers import BACKENDS
+
         self.dialog = ctk.CTkToplevel(parent)
         self.dialog.title("Settings")
-        self.dialog.geometry("400x340")  # Increased height for new shortcut options
+        self.dialog.geometry("400x650")  # Increased height for shortcut, recording and typing options and errors
         self.dialog.transient(parent)
         self.dialog.resizable(False, False)
 
-        # Store reference to callback function
-        self.callback = callback
-
-        # Load current settings
-        with open('settings.json', 'r') as f:
-            self.settings = json.load(f)
+        # Changes are saved through the settings service, which tells the app
+        self.settings = settings
 
         # API Key input
         self.api_frame = ctk.CTkFrame(self.dialog)
@@ -55,7 +105,7 @@ class SettingsDialog:
             font=ctk.CTkFont(size=14)
         )
         self.api_entry.pack(pady=10)
-        self.api_entry.insert(0, self.settings.get('api_key', ''))
+        self.api_entry.insert(0, self.settings.get('api_key'))
 
         # Keyboard shortcut options
         self.shortcut_frame = ctk.CTkFrame(self.dialog)
@@ -69,7 +119,7 @@ class SettingsDialog:
         self.shortcut_label.pack(anchor="w", padx=10, pady=5)
 
         # Get current shortcut or default to F2
-        current_shortcut = self.settings.get('shortcut', 'f2')
+        current_shortcut = self.settings.get('shortcut')
         
         # Define available shortcuts
         self.shortcuts = {
@@ -95,6 +145,100 @@ class SettingsDialog:
             )
             shortcut_radio.pack(anchor="w", padx=20, pady=(2, bottom_padding))
 
+        # Streaming mode types results while still recording
+        self.streaming_var = ctk.BooleanVar(value=self.settings.get('streaming'))
+        self.streaming_check = ctk.CTkCheckBox(
+            self.dialog,
+            text="Stream audio while recording",
+            variable=self.streaming_var,
+            font=ctk.CTkFont(size=12)
+        )
+        self.streaming_check.pack(anchor="w", padx=30, pady=(0, 5))
+
+        # Interim results are typed right away and corrected as they change
+        self.interim_var = ctk.BooleanVar(value=self.settings.get('interim_typing'))
+        self.interim_check = ctk.CTkCheckBox(
+            self.dialog,
+            text="Type while speaking (streaming only)",
+            variable=self.interim_var,
+            font=ctk.CTkFont(size=12)
+        )
+        self.interim_check.pack(anchor="w", padx=30, pady=(0, 5))
+
+        # Recordings stay in memory unless the user wants to keep them
+        self.keep_recordings_var = ctk.BooleanVar(value=self.settings.get('keep_recordings'))
+        self.keep_recordings_check = ctk.CTkCheckBox(
+            self.dialog,
+            text="Keep recordings in the recordings folder",
+            variable=self.keep_recordings_var,
+            font=ctk.CTkFont(size=12)
+        )
+        self.keep_recordings_check.pack(anchor="w", padx=30, pady=(5, 0))
+
+        # Voice activity detection trims silence and splits long dictations at pauses
+        self.vad_var = ctk.BooleanVar(value=self.settings.get('vad'))
+        self.vad_check = ctk.CTkCheckBox(
+            self.dialog,
+            text="Skip silence and split at pauses",
+            variable=self.vad_var,
+            font=ctk.CTkFont(size=12)
+        )
+        self.vad_check.pack(anchor="w", padx=30, pady=(5, 0))
+
+        # Upload encoding, flac and opus need the optional soundfile package
+        self.encoding_frame = ctk.CTkFrame(self.dialog, fg_color="transparent")
+        self.encoding_frame.pack(fill="x", padx=30, pady=(10, 0))
+        self.encoding_label = ctk.CTkLabel(
+            self.encoding_frame,
+            text="Upload encoding:",
+            font=ctk.CTkFont(size=12)
+        )
+        self.encoding_label.pack(side="left")
+        self.encoding_var = ctk.StringVar(value=self.settings.get('encoding'))
+        self.encoding_menu = ctk.CTkOptionMenu(
+            self.encoding_frame,
+            values=list(ENCODINGS),
+            variable=self.encoding_var,
+            width=100
+        )
+        self.encoding_menu.pack(side="left", padx=10)
+
+        # How transcripts are typed, clipboard mode needs the optional pyperclip package
+        self.typing_frame = ctk.CTkFrame(self.dialog, fg_color="transparent")
+        self.typing_frame.pack(fill="x", padx=30, pady=(10, 0))
+        self.typing_label = ctk.CTkLabel(
+            self.typing_frame,
+            text="Typing mode:",
+            font=ctk.CTkFont(size=12)
+        )
+        self.typing_label.pack(side="left")
+        self.typing_var = ctk.StringVar(value=self.settings.get('typing_mode'))
+        self.typing_menu = ctk.CTkOptionMenu(
+            self.typing_frame,
+            values=list(TYPING_MODES),
+            variable=self.typing_var,
+            width=100
+        )
+        self.typing_menu.pack(side="left", padx=10)
+
+        # Speech recognition backend, whisper runs offline and needs faster-whisper
+        self.backend_frame = ctk.CTkFrame(self.dialog, fg_color="transparent")
+        self.backend_frame.pack(fill="x", padx=30, pady=(10, 0))
+        self.backend_label = ctk.CTkLabel(
+            self.backend_frame,
+            text="Recognizer:",
+            font=ctk.CTkFont(size=12)
+        )
+        self.backend_label.pack(side="left")
+        self.backend_var = ctk.StringVar(value=self.settings.get('backend'))
+        self.backend_menu = ctk.CTkOptionMenu(
+            self.backend_frame,
+            values=[backend for backend in BACKENDS if backend != 'fake'],
+            variable=self.backend_var,
+            width=100
+        )
+        self.backend_menu.pack(side="left", padx=10)
+
         # Save button
         self.save_btn = ctk.CTkButton(
             self.dialog,
@@ -102,18 +246,34 @@ class SettingsDialog:
             command=self.save_settings,
             width=100
         )
-        self.save_btn.pack(pady=15)
+        self.save_btn.pack(pady=(15, 0))
+
+        # Why saving failed, e.g. a settings.json that can't be read
+        self.message_label = ctk.CTkLabel(
+            self.dialog,
+            text=settings.error or "",
+            text_color="red",
+            font=ctk.CTkFont(size=12),
+            wraplength=350
+        )
+        self.message_label.pack(pady=(5, 10))
 
     def save_settings(self):
-        self.settings['api_key'] = self.api_entry.get()
-        self.settings['shortcut'] = self.shortcut_var.get()
-        with open('settings.json', 'w') as f:
-            json.dump(self.settings, f)
-        
-        # Execute callback if provided to update UI
-        if self.callback:
-            self.callback()
-            
+        try:
+            self.settings.update({
+                'api_key': self.api_entry.get(),
+                'shortcut': self.shortcut_var.get(),
+                'streaming': self.streaming_var.get(),
+                'interim_typing': self.interim_var.get(),
+                'keep_recordings': self.keep_recordings_var.get(),
+                'vad': self.vad_var.get(),
+                'encoding': self.encoding_var.get(),
+                'typing_mode': self.typing_var.get(),
+                'backend': self.backend_var.get(),
+            })
+        except SettingsError as e:
+            self.message_label.configure(text=f"Can't save settings: {str(e)}")
+            return
         self.dialog.destroy()
 
 
@@ -124,48 +284,166 @@ class VoiceTyperApp:
         self.root.geometry("400x250")
         self.root.minsize(400, 250)
 
-        # Initialize variables
-        self.is_recording = False
-        self.file_ready_counter = 0
-        self.stop_recording = False
+        self.init_state()
         self.pykeyboard = keyboard.Controller()
+
+        self.load_settings()
+        # Worker threads update widgets only through this queue
+        self.ui = UiQueue(self.root, self.settings.get('ui_fps'))
+        # Stage timings of recent dictations, shown as p50/p95 and exportable
+        self.metrics = MetricsStore(self.settings.get('metrics_samples'), self.settings.get('metrics_file'))
+        if self.settings.error:
+            # Nothing is saved until the file is fixed, the user has to know why
+            self.show_error(self.settings.error)
+
+        # Only the window and the hotkey are set up before the window appears
+        self.start_hidden = self.settings.get('start_in_tray')
+        if self.start_hidden:
+            # Not even the window, it is built when it is first shown from the tray.
+            # The queue and the settings watcher wait for that too, like in minimize_to_tray
+            self.root.withdraw()
+            self.settings.stop()
+        else:
+            self.setup_ui()
+            self.ui.start()
+        self.startup_timings['window'] = time.perf_counter()
+        self.setup_injector()
+        self.setup_hotkey()
+        self.startup_timings['hotkey'] = time.perf_counter()
+
+        # Add window close event handler
+        self.root.protocol("WM_DELETE_WINDOW", self.close_window)
+        # Resumes the recording animation when the window is shown again
+        self.root.bind('<Map>', self.on_window_mapped)
+
+        # The audio stack, recognizer and tray load once the window was drawn
+        self.root.after_idle(
+            lambda: threading.Thread(target=self.load_components, daemon=True).start()
+        )
+
+    def init_state(self):
+        """Sets up the state of the app that isn't a widget or a device, also used by tools/headless_app.py."""
+        self.is_recording = False
+        self.capture_session = None  # Audio of the recording in progress
+        self.capture = None  # Microphone stream, opened in setup_capture
+        self.pyaudio_module = None  # PyAudio, or a stand-in like tools/fakes.FakePyAudio
+        self.capture_users = 0  # Recordings still reading from the capture, guarded by record_lock
+        self.capture_pending = False  # Capture settings changed while it was in use
+        self.chimes = None  # Start/stop sounds, loaded in load_components
+        self.startup_error = None  # Why load_components failed, recording is impossible then
+        self.jobs = None  # Recordings waiting for transcription, created in start_transcription_thread
+        self.output = None  # Typing stage, created in start_transcription_thread
+        self.transcription_pool = None
+        self.spool = None  # Audio of failed jobs, kept until they are transcribed
+        self.history = None  # Transcript log and search index, opened in load_components
+        self.rules = None  # Replacements applied to transcripts before typing, loaded in load_components
+        self.last_timings = {}  # Stage durations of the last typed transcript
+        # perf_counter() when the window, the hotkey and everything else were ready
+        self.startup_timings = {}
+        self.components_ready = threading.Event()
+        self.start_when_ready = False  # Hotkey pressed while still loading
+        self.start_profile = None  # and the profile it was pressed for
+        self.startup_lock = threading.Lock()
+        self.record_lock = threading.Lock()  # The hotkey thread and the GUI both toggle recording
         self.recording_animation_active = False
+        self.animation_id = 0  # Only the newest animation loop keeps running
+        self.animation_paused = False  # Set while the window is hidden
         
         # Initialize hotkey related variables
         self.hotkey_listener = None  # Store the hotkey listener
+
+        # Tray icon, images and menu are set up in load_components, the icon runs while the window is hidden
+        self.tray_icon = None
+        self.tray_menu = None
+        self.log_stale = False  # The log view was emptied while hidden
         
         # Flag for proper thread termination
         self.running = True
         
         # Flag to track if UI has been set up
         self.ui_initialized = False
-
-        # Try to load settings and initialize Deepgram
-        try:
-            self.load_settings()
-        except DeepgramSetupError:
-            # Show settings dialog immediately if API key is invalid
-            self.setup_ui()  # Setup UI first
-            self.show_api_key_error()
-        except Exception as e:
-            self.setup_ui()
-            self.show_error(f"Error: {str(e)}")
-
-        # Initialize system tray
-        self.setup_system_tray()
+        self.start_hidden = False  # Set from start_in_tray once the settings are loaded
 
         # Track if log section is expanded
         self.log_expanded = False  # Start with log collapsed
 
-        # Setup UI only if not already initialized
-        if not self.ui_initialized:
-            self.setup_ui()
-            
-        self.setup_hotkey()  # Set up hotkey after loading settings
-        self.start_transcription_thread()
+    def load_components(self):
+        """Loads the heavy parts of the app on a background thread.
 
-        # Add window close event handler
-        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
+        Sounds and the tray icon are optional, the app records without them.
+        If anything else fails the error is shown and kept in startup_error,
+        components_ready is set either way so the hotkey never waits forever.
+        """
+        error = None
+        try:
+            try:
+                self.setup_chimes()
+            except Exception as e:
+                print(f"Can't load the sounds: {str(e)}")
+            self.setup_history()
+            self.setup_rules()
+            self.setup_capture()
+            try:
+                self.setup_system_tray()
+            except Exception as e:
+                print(f"Can't set up the tray icon: {str(e)}")
+
+            try:
+                self.setup_recognizer()
+            except ApiKeyError as e:
+                error = e
+            except Exception as e:
+                error = Exception(f"Failed to initialize recognizer: {str(e)}")
+            # Started after the recognizer, spooled jobs are sent right away. Not after
+            # quit_app, nothing would stop the pool then
+            with self.startup_lock:
+                if self.running:
+                    self.start_transcription_thread()
+        except Exception as e:
+            self.startup_error = f"Failed to start: {str(e)}"
+            error = Exception(self.startup_error)
+        finally:
+            self.ui.post(None, self.on_components_loaded, error)
+            # Not on the main loop, the hotkey has to work while the window is hidden
+            self.startup_timings['ready'] = time.perf_counter()
+            with self.startup_lock:
+                self.components_ready.set()
+                closed = not self.running
+                start = self.start_when_ready
+                self.start_when_ready = False
+        if closed:
+            # quit_app ran while loading and left what was loaded to this thread
+            self.stop_components()
+            return
+        if self.start_hidden:
+            if self.tray_menu is not None:
+                self.show_tray_icon()
+            else:
+                # Without a tray icon the window is the only way in
+                self.root.after(0, self.restore_window)
+        if start:
+            self.toggle_recording(self.start_profile)
+
+    def setup_chimes(self):
+        from audio import ChimePlayer
+
+        # Chimes are decoded once and played without blocking
+        self.chimes = ChimePlayer({
+            name: os.path.join(ASSETS_DIR, f"{name}.wav") for name in ('on', 'off', 'model_loaded')
+        })
+
+    def play_chime(self, name):
+        if self.chimes:
+            self.chimes.play(name)
+
+    def on_components_loaded(self, error):
+        if self.history:
+            self.refill_log()
+        if isinstance(error, ApiKeyError):
+            # Show settings dialog immediately if API key is invalid
+            self.show_api_key_error()
+        elif error is not None:
+            self.show_error(f"Error: {str(error)}")
 
     def show_api_key_error(self):
         error_dialog = ctk.CTkToplevel(self.root)
@@ -196,21 +474,26 @@ class VoiceTyperApp:
             font=ctk.CTkFont(size=14)
         )
         api_entry.pack(pady=10)
-        api_entry.insert(0, self.settings.get('api_key', ''))
+        api_entry.insert(0, self.settings.get('api_key'))
 
         def save_and_retry():
             new_key = api_entry.get()
             try:
                 # Try to initialize Deepgram with new key
-                self.deepgram = Deepgram(new_key)
-                # If successful, save the new key
-                self.settings['api_key'] = new_key
-                with open('settings.json', 'w') as f:
-                    json.dump(self.settings, f)
-                error_dialog.destroy()
-                self.status_label.configure(text="API Key updated successfully!")
-            except DeepgramSetupError:
+                create_deepgram_client(self.settings, new_key)
+            except ApiKeyError:
                 message.configure(text="Invalid API Key. Please try again.", text_color="red")
+                return
+            # If successful, save the new key, on_settings_changed sets up the recognizer
+            try:
+                changed = self.settings.update({'api_key': new_key})
+            except SettingsError as e:
+                message.configure(text=str(e), text_color="red")
+                return
+            if not changed:
+                self.on_settings_changed({'api_key'})  # Same key as before, retry anyway
+            error_dialog.destroy()
+            self.set_status("API Key updated successfully!")
 
         # Save button
         save_btn = ctk.CTkButton(
@@ -222,43 +505,123 @@ class VoiceTyperApp:
         save_btn.pack(pady=20)
 
     def show_error(self, error_message):
-        self.status_label.configure(
-            text=error_message,
-            text_color="red"
-        )
+        self.set_status(error_message, "red")
 
-    def load_settings(self):
-        try:
-            with open('settings.json', 'r') as f:
-                self.settings = json.load(f)
-            # Ensure shortcut is set, default to 'f2' if not
-            if 'shortcut' not in self.settings:
-                self.settings['shortcut'] = 'f2'
-                with open('settings.json', 'w') as f:
-                    json.dump(self.settings, f)
-        except FileNotFoundError:
-            self.settings = {'api_key': '', 'shortcut': 'f2'}
-            with open('settings.json', 'w') as f:
-                json.dump(self.settings, f)
+    def set_status(self, text, color=None):
+        """Shows text in the status line, from any thread."""
+        self.ui.post('status', self._show_status, text, color)
 
+    def _show_status(self, text, color):
+        self.status_label.configure(text=text, text_color=color or self.status_color)
+
+    def load_settings(self):
+        # Read once, the dialog and edits of settings.json go through on_settings_changed.
+        # Missing keys fall back to the defaults in config.SCHEMA
+        self.settings = Settings('settings.json', defaults={'api_key': '', 'shortcut': 'f2'})
+        self.settings.subscribe(self.on_settings_changed)
+        self.settings.watch()
+
+    def setup_recognizer(self):
+        from recognizers import DEFAULT_PROFILE, create_profiles
+
+        # Every profile has its own recognizer, self.recognizer is the default one
+        profiles = create_profiles(self.settings, self.metrics.record_cache)
+
+        # The Deepgram SDK clients serve the streaming mode with each profile's API key and URL,
+        # the default profile's one also validates the key
+        live_clients = {}
+        for name, profile in profiles.items():
+            settings = dict(self.settings, **profile.overrides)
+            if settings.get('backend', self.settings.get('backend')) != 'deepgram':
+                continue
+            try:
+                live_clients[name] = create_deepgram_client(settings)
+            except ApiKeyError as e:
+                if name == DEFAULT_PROFILE:
+                    raise
+                self.show_error(f"Profile {name} can't stream: {str(e)}")
+
+        previous = getattr(self, 'profiles', {})
+        self.profiles = profiles
+        self.live_clients = live_clients
+        self.recognizer = self.profiles[DEFAULT_PROFILE].recognizer
+        if self.transcription_pool:
+            for profile in previous.values():
+                self.transcription_pool.call_soon(profile.recognizer.close())
+            self.connect_profiles()
+
+        # Local models are loaded once in the background and kept warm
+        for profile in self.profiles.values():
+            if profile.recognizer.needs_warmup:
+                threading.Thread(target=self.warm_up_recognizer, args=(profile.recognizer,), daemon=True).start()
+
+    def connect_profiles(self):
+        # Handshakes happen now instead of on the first dictation with each profile
+        for profile in self.profiles.values():
+            self.transcription_pool.call_soon(profile.recognizer.connect())
+
+    def get_profile(self, name):
+        from recognizers import DEFAULT_PROFILE
+
+        return self.profiles.get(name) or self.profiles[DEFAULT_PROFILE]
+
+    def profile_setting(self, name, key):
+        """A setting as the profile sees it, the profile's overrides win."""
+        overrides = self.get_profile(name).overrides
+        return overrides[key] if key in overrides else self.settings.get(key)
+
+    def warm_up_recognizer(self, recognizer):
         try:
-            self.deepgram = Deepgram(self.settings['api_key'])
-        except DeepgramSetupError:
-            raise
+            recognizer.load()
         except Exception as e:
-            raise Exception(f"Failed to initialize Deepgram: {str(e)}")
+            self.set_status(f"Failed to load model: {str(e)}")
+            return
+        self.play_chime('model_loaded')
+        if self.ui_initialized:
+            self.set_status("Model loaded, ready to record...")
 
     def setup_system_tray(self):
-        # Create system tray icon
-        self.icon_image = Image.new('RGB', (64, 64), color='blue')
+        import pystray
+        from PIL import Image, ImageDraw
+
+        # The app icon, and a copy with a red dot while recording
+        icon = Image.open(os.path.join(ASSETS_DIR, "app_icon.ico")).convert('RGBA').resize((64, 64))
+        recording = icon.copy()
+        ImageDraw.Draw(recording).ellipse((30, 30, 62, 62), fill="#c93434", outline="white", width=3)
+        self.tray_images = {False: icon, True: recording}
+        self.tray_menu = pystray.Menu(
+            pystray.MenuItem("Show", self.show_window, default=True),
+            pystray.MenuItem(
+                lambda item: "Stop Recording" if self.is_recording else "Start Recording",
+                lambda: self.toggle_recording()
+            ),
+            # quit_app uses Tk, so it runs on the main loop
+            pystray.MenuItem("Exit", lambda: self.root.after(0, self.quit_app))
+        )
+
+    def show_tray_icon(self):
+        import pystray
+
+        # A new icon every time, not every pystray backend can run one again after stop()
         self.tray_icon = pystray.Icon(
-            "Voice Typer",
-            self.icon_image,
-            menu=pystray.Menu(
-                pystray.MenuItem("Show", self.show_window),
-                pystray.MenuItem("Exit", self.quit_app)
-            )
+            "Voice Typer", self.tray_images[self.is_recording], self.tray_title(), menu=self.tray_menu
         )
+        threading.Thread(target=self.tray_icon.run, daemon=True).start()
+
+    def tray_title(self):
+        return "Voice Typer - recording" if self.is_recording else "Voice Typer"
+
+    def update_tray_icon(self):
+        # pystray redraws from any thread, the hidden window is left alone
+        icon = self.tray_icon
+        if icon is not None:
+            icon.icon = self.tray_images[self.is_recording]
+            icon.title = self.tray_title()
+            icon.update_menu()
+
+    def on_recording_changed(self):
+        self.ui.post('record_button', self.update_record_button)
+        self.update_tray_icon()
 
     def setup_ui(self):
         # Mark UI as initialized
@@ -294,7 +657,7 @@ class VoiceTyperApp:
         self.control_frame.pack(fill="x", pady=10)
 
         # Get the current shortcut display text
-        shortcut_key = self.settings.get('shortcut', 'f2')
+        shortcut_key = self.settings.get('shortcut')
         shortcut_display = self.get_shortcut_display(shortcut_key)
         
         self.record_button = ctk.CTkButton(
@@ -321,6 +684,16 @@ class VoiceTyperApp:
             font=ctk.CTkFont(size=12)
         )
         self.status_label.pack(pady=5)
+        self.status_color = self.status_label.cget("text_color")
+
+        # Latency percentiles of recent dictations
+        self.metrics_label = ctk.CTkLabel(
+            self.main_frame,
+            text=self.metrics.summary_text(),
+            font=ctk.CTkFont(size=11),
+            text_color="gray"
+        )
+        self.metrics_label.pack(pady=(0, 5))
 
         # Create a container frame for log section
         self.log_container = ctk.CTkFrame(self.main_frame, fg_color="transparent")
@@ -349,8 +722,26 @@ class VoiceTyperApp:
         )
         self.clear_log_btn.pack(side="right", padx=5)
 
+        self.export_metrics_btn = ctk.CTkButton(
+            self.log_container,
+            text="Export Metrics",
+            command=self.export_metrics,
+            width=100,
+            height=28,
+            fg_color=["#2B2B2B", "#333333"],
+            hover_color=["#333333", "#404040"]
+        )
+        self.export_metrics_btn.pack(side="right", padx=5)
+
         # Log frame and content
         self.log_frame = ctk.CTkFrame(self.main_frame)
+        self.search_entry = ctk.CTkEntry(
+            self.log_frame,
+            placeholder_text="Search history...",
+            font=ctk.CTkFont(size=12)
+        )
+        self.search_entry.pack(fill="x", pady=(5, 0))
+        self.search_entry.bind('<Return>', self.search_history)
         self.transcription_text = ctk.CTkTextbox(
             self.log_frame,
             height=200,
@@ -358,42 +749,79 @@ class VoiceTyperApp:
         )
         self.transcription_text.pack(fill="both", expand=True, pady=5)
 
-    def animate_recording(self):
-        if self.recording_animation_active:
-            current = self.recording_indicator.get()
-            if current >= 1:
-                self.recording_indicator.set(0)
-            else:
-                self.recording_indicator.set(current + 0.05)  # Smoother animation
-            self.root.after(50, self.animate_recording)  # Faster updates
+    def start_animation(self):
+        self.recording_animation_active = True
+        self.animation_paused = False
+        self.animation_id += 1
+        self.animate_recording(self.animation_id, 0)
 
-            # Pulse effect on record button
-            current_color = self.record_button.cget("fg_color")
-            if current_color == "#c93434":
-                self.record_button.configure(fg_color="#a82a2a")
-            else:
-                self.record_button.configure(fg_color="#c93434")
+    def animate_recording(self, animation_id, frame):
+        if not self.recording_animation_active or animation_id != self.animation_id:
+            return
+        if self.root.state() in ('withdrawn', 'iconic'):
+            # Nothing to draw while hidden, on_window_mapped picks it up again
+            self.animation_paused = True
+            return
+        self.recording_indicator.set(frame % 20 / 20)
+        # Pulse the record button twice a second rather than redrawing it every frame
+        if frame % 10 == 0:
+            self.record_button.configure(fg_color="#a82a2a" if frame % 20 else "#c93434")
+        self.root.after(50, self.animate_recording, animation_id, frame + 1)
+
+    def on_window_mapped(self, event):
+        if event.widget is self.root and self.recording_animation_active and self.animation_paused:
+            self.start_animation()
+
+    def toggle_recording(self, profile=None):
+        """Starts or stops recording. Safe to call from the hotkey thread, the UI follows via the queue.
+
+        profile names the recognition profile of a new recording, None is the default one.
+        """
+        with self.startup_lock:
+            loading = not self.components_ready.is_set()
+            if loading:
+                # The hotkey works before the audio stack has loaded, record as soon as it has
+                self.start_when_ready = not self.start_when_ready
+                self.start_profile = profile
+                waiting = self.start_when_ready
+        if loading:
+            self.set_status("Starting up, recording begins in a moment..." if waiting else "Ready to record...")
+            return
+        if self.startup_error:
+            self.show_error(self.startup_error)
+            return
 
-    def toggle_recording(self):
-        if not hasattr(self, 'deepgram'):
-            self.show_api_key_error()
+        if not hasattr(self, 'recognizer'):
+            self.ui.post('api_key_error', self.show_api_key_error)
             return
 
+        with self.record_lock:
+            if not self.is_recording:
+                self.start_recording(profile)
+            else:
+                self.stop_recording()
+        self.on_recording_changed()
+
+    def stop_recording(self):
+        # Called with record_lock held
+        self.is_recording = False
+        self.capture_session.stop()
+        self.play_chime('off')
+
+    def update_record_button(self):
         # Get the current shortcut display text
-        shortcut_key = self.settings.get('shortcut', 'f2')
+        shortcut_key = self.settings.get('shortcut')
         shortcut_display = self.get_shortcut_display(shortcut_key)
-        
-        if not self.is_recording:
-            self.start_recording()
-            # Start animation with pulsing effect
-            self.recording_animation_active = True
+
+        if self.is_recording:
             self.record_button.configure(
                 fg_color="#c93434",
                 text=f"■ Stop Recording ({shortcut_display})"
             )
-            self.animate_recording()
+            # Start animation with pulsing effect
+            if not self.recording_animation_active:
+                self.start_animation()
         else:
-            self.stop_recording = True
             # Stop animation
             self.recording_animation_active = False
             self.record_button.configure(
@@ -403,13 +831,14 @@ class VoiceTyperApp:
             self.recording_indicator.set(0)
 
     def setup_hotkey(self):
-        """Sets up the hotkey based on current settings."""
-        # If a hotkey listener already exists, stop it
-        if hasattr(self, 'hotkey_listener') and self.hotkey_listener:
-            self.hotkey_listener.stop()
-            
+        """Sets up the hotkeys based on current settings.
+
+        Profile hotkeys and the cancel shortcut are checked first, invalid or
+        taken ones are skipped and reported. The old listener keeps working
+        until the new one could be built.
+        """
         # Get configured shortcut
-        shortcut = self.settings.get('shortcut', 'f2')
+        shortcut = self.settings.get('shortcut')
         
         # Map virtual key codes for function keys
         # F2 = 113, F12 = 123
@@ -424,114 +853,533 @@ class VoiceTyperApp:
             hotkey_map['<ctrl>+<123>'] = self.toggle_recording  # Ctrl + F12
         elif shortcut == 'alt+f12':
             hotkey_map['<alt>+<123>'] = self.toggle_recording  # Alt + F12
-            
-        # Create a new GlobalHotKeys listener
-        self.hotkey_listener = keyboard.GlobalHotKeys(hotkey_map)
+
+        # Key combinations in use, "<ctrl>+g" and "<CTRL>+G" are the same one
+        taken = {frozenset(keyboard.HotKey.parse(hotkey)) for hotkey in hotkey_map}
+        problems = []
+
+        def add(hotkey, callback, owner):
+            try:
+                keys = frozenset(keyboard.HotKey.parse(hotkey))
+            except (ValueError, TypeError, AttributeError):
+                problems.append(f"{owner}: {hotkey!r} is not a valid hotkey")
+                return
+            if keys in taken:
+                problems.append(f"{owner}: {hotkey} is already in use")
+                return
+            taken.add(keys)
+            hotkey_map[hotkey] = callback
+
+        # Aborts typing of a long transcript, an empty shortcut turns it off
+        if self.settings.get('cancel_shortcut'):
+            add(self.settings.get('cancel_shortcut'), self.cancel_typing, "cancel_shortcut")
+
+        # Profiles with a hotkey of their own record with their recognition options
+        for name, profile in (self.settings.get('profiles') or {}).items():
+            if isinstance(profile, dict) and profile.get('hotkey'):
+                add(profile['hotkey'], lambda name=name: self.toggle_recording(name), f"Profile {name}")
+
+        # Create a new GlobalHotKeys listener, the old one stays if that fails
+        try:
+            listener = keyboard.GlobalHotKeys(hotkey_map)
+        except Exception as e:
+            self.show_error(f"Can't set up the hotkeys: {str(e)}")
+            return
+        if self.hotkey_listener:
+            self.hotkey_listener.stop()
+        self.hotkey_listener = listener
         
         # Start the listener
         self.hotkey_listener.start()
+        if problems:
+            self.show_error("Ignoring hotkeys: " + "; ".join(problems))
+
+    def setup_capture(self):
+        """Opens the capture with the current settings, or once no recording uses it anymore."""
+        from audio import CaptureEngine
+
+        channels = self.settings.get('capture_channels')
+        fs = self.settings.get('capture_rate')
+        persistent = self.settings.get('persistent_capture')
+        with self.record_lock:
+            if self.capture_users:
+                # Recordings keep the stream they started with, release_capture() comes back here
+                self.capture_pending = True
+                return
+            self.capture_pending = False
+            previous = self.capture
+            # A recording started from here on opens the new stream itself if it isn't open yet
+            self.capture = CaptureEngine(
+                channels,
+                fs,
+                pre_roll_ms=self.settings.get('pre_roll_ms'),
+                persistent=persistent,
+                pyaudio_module=self.pyaudio_module
+            )
+        if previous is not None:
+            previous.close()
+        if persistent:
+            # Open the device once at startup, recordings then start instantly
+            try:
+                self.capture.open()
+            except Exception as e:
+                print(f"Can't open microphone: {str(e)}")
+
+    def start_recording(self, profile=None):
+        # Called with record_lock held, only flips state: the device is opened
+        # and the audio handled on the recording's own thread
+        pressed_at = time.perf_counter()
+        # Reconnects the profile's client while the user speaks, if it was idle
+        self.transcription_pool.call_soon(self.get_profile(profile).recognizer.connect())
+        session = self.capture.begin()
+        self.capture_users += 1  # Released by the recording thread, see release_capture
+        # Each recording gets its own session, so a quick F2 press can't
+        # stop or restart a recording that is still finishing
+        self.is_recording = True
+        self.capture_session = session
+        self.play_chime('on')
+        threading.Thread(target=self.record_speech, args=(session, pressed_at, profile), daemon=True).start()
 
-    def start_recording(self):
-        threading.Thread(target=self.record_speech, daemon=True).start()
+    def record_speech(self, session, pressed_at=None, profile=None):
+        from audio import AudioEncoder, PcmConverter, SpeechSegmenter
+        from pipeline import Job
 
-    def record_speech(self):
-        self.is_recording = True
-        chunk = 1024
-        sample_format = pyaudio.paInt16
-        channels = 2
-        fs = 44100
-
-        p = pyaudio.PyAudio()
-        stream = p.open(
-            format=sample_format,
-            channels=channels,
-            rate=fs,
-            frames_per_buffer=chunk,
-            input=True
-        )
-
-        frames = []
-        playsound("assets/on.wav")
-
-        while not self.stop_recording:
-            data = stream.read(chunk)
-            frames.append(data)
-
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
-        playsound("assets/off.wav")
-
-        # Save recording
-        wf = wave.open(f"test{self.file_ready_counter + 1}.wav", 'wb')
-        wf.setnchannels(channels)
-        wf.setsampwidth(p.get_sample_size(sample_format))
-        wf.setframerate(fs)
-        wf.writeframes(b''.join(frames))
-        wf.close()
-
-        self.stop_recording = False
-        self.is_recording = False
-        self.file_ready_counter += 1
-
-        self.status_label.configure(text="Processing transcription...")
-
-    async def transcribe_audio(self, audio_file):
-        with open(audio_file, 'rb') as audio:
-            source = {'buffer': audio, 'mimetype': 'audio/wav'}
-            options = {
-                'punctuate': True,
-                # 'language': 'en',
-                'detect_language': True,
-                # 'model': 'general',
-                'model': 'nova-3'
-            }
-            response = await self.deepgram.transcription.prerecorded(source, options)
-            return response['results']['channels'][0]['alternatives'][0]['transcript']
+        try:
+            self.capture.open()  # Already open unless persistent_capture is off
+        except Exception as e:
+            self.abort_recording(session)
+            self.release_capture()
+            self.show_error(f"Can't open microphone: {str(e)}")
+            return
+        capture_before = self.capture.stats()
+
+        channels = self.capture.channels
+        fs = self.capture.rate
+        sample_rate = self.settings.get('sample_rate')
+
+        live = live_job = None
+        # Streaming goes through the Deepgram live API, both can be set per profile
+        if self.profile_setting(profile, 'streaming') and self.profile_setting(profile, 'backend') == 'deepgram':
+            # Times the streamed dictation for the metrics, there is no upload to time
+            live_job = Job(None, 'audio/l16')
+            live_job.profile = profile
+            live = self.start_live_transcription(1, sample_rate, profile, live_job)
+
+        # Audio is downmixed, resampled and encoded into memory while recording,
+        # the disk copy is optional. Also while streaming: if the live session
+        # fails, the recording is transcribed like any other
+        keep_recordings = self.settings.get('keep_recordings')
+        encoding = self.settings.get('encoding')
+        fallback = [] if live else None  # Jobs kept until the live session finished
+        converter = PcmConverter(channels, fs, sample_rate)
+        # Long dictations spill to a temporary file past this size
+        max_resident_bytes = int(self.settings.get('max_buffer_mb') * 1024 * 1024)
+
+        # Optional voice activity detection trims silence and splits the
+        # recording at pauses into segments that are transcribed right away
+        segmenter = None
+        if self.settings.get('vad'):
+            segmenter = SpeechSegmenter(sample_rate, split_ms=self.settings.get('vad_split_ms'))
+        auto_stop_ms = self.settings.get('auto_stop_ms') if segmenter else 0
+
+        encoder = None
+        if not segmenter:
+            encoder = AudioEncoder(channels, fs, sample_rate, encoding, converter, max_resident_bytes)
+
+        def marks(stopped_at):
+            # Stage timestamps shared by every job of this recording
+            return {'pressed': pressed_at, 'first_audio': session.first_audio_at, 'stopped': stopped_at}
+
+        def handle_segment_event(event, samples):
+            nonlocal encoder
+            if event == 'start':
+                encoder = AudioEncoder(channels, fs, sample_rate, encoding, converter, max_resident_bytes)
+            elif event == 'audio':
+                encoder.write_samples(samples)
+                if live:
+                    live.send(samples.tobytes())
+            else:
+                self.finish_segment(encoder, marks(time.perf_counter()), keep_recordings, fallback, profile)
+                encoder = None
+
+        for data in session:
+            samples = converter.convert(data)
+            if not segmenter:
+                encoder.write_samples(samples)
+                if live:
+                    live.send(samples.tobytes())
+                continue
+
+            for event, speech in segmenter.process(samples):
+                handle_segment_event(event, speech)
+            # Hands-free mode: stop by itself after a long enough pause
+            if auto_stop_ms and segmenter.silence_ms >= auto_stop_ms:
+                self.auto_stop_recording(session)
+        self.capture.end(session)
+        if live:
+            # Text typed from here on is what the user waits for
+            for stage, timestamp in marks(session.stopped_at).items():
+                if timestamp is not None:
+                    live_job.mark(stage, timestamp)
+        self.check_capture(capture_before)
+        self.release_capture()
+
+        if segmenter:
+            for event, speech in segmenter.flush():
+                handle_segment_event(event, speech)
+            self.set_status(f"Trimmed {segmenter.removed_ms / 1000:.1f}s of silence")
+        else:
+            self.finish_segment(encoder, marks(session.stopped_at), keep_recordings, fallback, profile)
+
+        if live:
+            self.finish_live_transcription(live, fallback, live_job)
+
+    def finish_segment(self, encoder, marks, keep_recordings, fallback, profile):
+        """Turns an encoded segment into a job and queues it, or keeps it in fallback while streaming."""
+        from audio import buffer_size, save_recording
+        from pipeline import Job
+
+        audio = encoder.close()
+        encoded_at = time.perf_counter()
+        if audio and keep_recordings:
+            save_recording(audio, extension=encoder.extension)
+
+        job = Job(audio, encoder.mimetype)
+        for stage, timestamp in marks.items():
+            if timestamp is not None:
+                job.mark(stage, timestamp)
+        job.mark('encoded', encoded_at)
+        job.audio_seconds = encoder.duration
+        job.audio_bytes = buffer_size(audio)
+        job.profile = profile
+        if fallback is not None:
+            fallback.append(job)
+        else:
+            self.queue_job(job)
+
+    def queue_job(self, job):
+        if self.settings.get('spool_all'):
+            # Survives a crash while the job waits or is being uploaded
+            self.spool.save(job)
+        if len(self.jobs) >= self.jobs.maxsize:
+            self.set_status("Waiting for pending transcriptions...")
+        # Blocks while the queue is full instead of piling up recordings
+        if self.jobs.put(job):
+            self.set_status("Processing transcription...")
+
+    def abort_recording(self, session):
+        with self.record_lock:
+            if self.capture_session is session:
+                self.is_recording = False
+        self.capture.end(session)
+        self.on_recording_changed()
+
+    def release_capture(self):
+        """Called by a recording that is done with the capture, applies settings changed meanwhile."""
+        with self.record_lock:
+            self.capture_users -= 1
+            reopen = self.capture_pending and not self.capture_users
+        if reopen:
+            self.setup_capture()
+
+    def check_capture(self, before):
+        """Counts and reports audio the device or the capture ring lost during a recording."""
+        after = self.capture.stats()
+        overflows = after['overflows'] - before['overflows']
+        dropped_frames = after['dropped_frames'] - before['dropped_frames']
+        self.metrics.record_capture(overflows, dropped_frames)
+        if overflows or dropped_frames:
+            self.show_error(f"Audio was lost while recording ({overflows} overflows, "
+                            f"{dropped_frames / self.capture.rate * 1000:.0f} ms dropped)")
+
+    def auto_stop_recording(self, session):
+        with self.record_lock:
+            # Only stop if this recording is still the current one
+            if not self.is_recording or self.capture_session is not session:
+                session.stop()
+                return
+            self.stop_recording()
+        self.on_recording_changed()
+
+    async def transcribe_audio(self, audio, mimetype='audio/wav', profile=None):
+        profile = self.get_profile(profile)
+        return await profile.recognizer.transcribe(audio, mimetype, dict(profile.options))
+
+    def start_live_transcription(self, channels, fs, profile=None, job=None):
+        from live import LiveTranscriber
+
+        profile = self.get_profile(profile)
+        client = self.live_clients.get(profile.name)
+        if client is None:
+            self.set_status(f"Streaming unavailable for profile {profile.name}")
+            return None
+        options = dict(profile.options)
+        # The live API can't detect the language
+        options.pop('detect_language', None)
+        options.update({
+            'encoding': 'linear16',
+            'sample_rate': fs,
+            'channels': channels,
+            'interim_results': True
+        })
+        # Optionally type interim results as they come and correct them in place
+        typer = None
+        if self.settings.get('interim_typing'):
+            typer = InterimTyper(self.injector, self.settings.get('interim_holdback_words'))
+        live = LiveTranscriber(
+            client, options, lambda transcript, is_final: self.on_live_transcript(transcript, is_final, typer, job)
+        )
+        try:
+            live.start()
+        except Exception as e:
+            # Fall back to the prerecorded path for this utterance
+            self.set_status(f"Streaming unavailable: {str(e)}")
+            return None
+        self.set_status("Streaming...")
+        return live
+
+    def finish_live_transcription(self, live, fallback, job):
+        self.set_status("Processing transcription...")
+        try:
+            live.finish()
+        except Exception as e:
+            # Transcribed from the kept audio instead. If part of it was typed already,
+            # the whole transcript only goes to the log, like a recovered dictation
+            typed = live.finals or (self.settings.get('interim_typing') and live.results)
+            for job in fallback:
+                job.recovered = bool(typed)
+                self.queue_job(job)
+            self.set_status(f"Streaming failed: {str(e)}, "
+                            + ("the transcript goes to the log" if typed else "transcribing the recording"))
+            return
+        job.audio_seconds = sum(segment.audio_seconds or 0.0 for segment in fallback)
+        # After the last final was typed, the typing stage runs it in order
+        self.output.post(None, self.record_live, job, live.finals > 0)
+        self.set_status("Ready to record...")
+
+    def on_live_transcript(self, transcript, is_final, typer=None, job=None):
+        # Interim results too, so typed text doesn't change when the final arrives
+        transcript = self.postprocess(transcript)
+        if typer is not None and (transcript or is_final):
+            # Interim results replace each other while typing lags behind,
+            # an empty final still has to erase the interim text of its segment
+            self.output.post(None if is_final else typer, self.type_live, typer, transcript, is_final, job)
+        if not transcript:
+            return
+        if not is_final:
+            if typer is None:
+                # Interim hypotheses may still change, show them without typing
+                self.set_status(f"... {transcript}")
+            return
 
-    def start_transcription_thread(self):
-        threading.Thread(target=self.transcribe_speech).start()
+        # Logged before it is posted, see refill_log
+        self.log_transcript(transcript)
+        self.ui.post(None, self.add_log_entry, transcript, "", time.time())
+        if typer is None:
+            # Final segments arrive without the separating space
+            self.output.post(None, self.type_live_final, transcript + ' ', job)
+
+    def type_live(self, typer, transcript, is_final, job, cancel_event):
+        stats = typer.update(transcript + ' ' if is_final and transcript else transcript, is_final, cancel_event)
+        self.mark_live_typing(job, stats)
+        if is_final:
+            self.set_status(f"Streaming... ({typer.keystrokes_per_char:.2f} keystrokes per char)")
+
+    def type_live_final(self, text, job, cancel_event):
+        self.mark_live_typing(job, self.type_text(None, text, cancel_event))
+
+    @staticmethod
+    def mark_live_typing(job, stats):
+        """Marks the first and last characters of a streamed dictation typed after it stopped."""
+        if job is None or stats.first_char_at is None or 'stopped' not in job.timings:
+            return
+        if stats.last_char_at < job.timings['stopped']:
+            return
+        if 'first_char' not in job.timings:
+            job.mark('first_char', max(stats.first_char_at, job.timings['stopped']))
+        job.mark('last_char', stats.last_char_at)
 
-    def transcribe_speech(self):
-        i = 1
+    def record_live(self, job, transcribed, cancel_event):
+        if transcribed and 'first_char' not in job.timings and 'stopped' in job.timings:
+            # Everything was typed while speaking, there was nothing to wait for
+            job.mark('first_char', job.timings['stopped'])
+        self.metrics.record(job)
+        self.ui.post('metrics', self.show_metrics)
 
-        while self.running:
-            while self.file_ready_counter < i and self.running:
-                time.sleep(0.01)
+    def setup_history(self):
+        from history import TranscriptHistory
 
-            if not self.running:
-                break
+        try:
+            self.history = TranscriptHistory(
+                db_path=self.settings.get('history_db'),
+                max_bytes=int(self.settings.get('log_max_kb') * 1024),
+                max_age_days=self.settings.get('log_max_days'),
+                backups=self.settings.get('log_backups')
+            )
+        except Exception as e:
+            print(f"Can't open the transcript history: {str(e)}")
+
+    def setup_rules(self):
+        from rules import RulesFile
+
+        self.rules = RulesFile(self.settings.get('rules_file'))
+
+    def postprocess(self, transcript):
+        # Voice commands, expansions and casing fixes, the file is reloaded when it changes
+        return self.rules.apply(transcript) if self.rules and transcript else transcript
+
+    def log_transcript(self, transcript):
+        # Written in batches on the history thread
+        if self.history:
+            self.history.add(transcript)
+
+    @staticmethod
+    def format_log_entry(created, text, prefix=""):
+        moment = datetime.fromtimestamp(created)
+        stamp = moment.strftime('%H:%M:%S' if moment.date() == datetime.now().date() else '%Y-%m-%d %H:%M')
+        # One line per entry plus a blank line, so the view can be capped by line number
+        return f"{prefix}{stamp}: {text.replace(chr(10), ' ')}\n\n"
+
+    def refill_log(self):
+        """Shows the newest transcripts from the history in place of the log view."""
+        # Every posted entry was logged before it was posted, so once they are
+        # dropped and the history is flushed, recent() has each of them exactly once
+        self.ui.discard(self.add_log_entry)
+        self.history.flush()
+        self.show_log_entries(self.history.recent(self.settings.get('log_view_entries')))
+
+    def add_log_entry(self, text, prefix="", created=None):
+        created = time.time() if created is None else created
+        self.transcription_text.insert('1.0', self.format_log_entry(created, text, prefix))
+        # Only the newest entries are kept in the widget, older ones are in the history
+        limit = self.settings.get('log_view_entries')
+        self.transcription_text.delete(f"{2 * limit + 1}.0", 'end')
+
+    def show_log_entries(self, entries, prefix=""):
+        self.transcription_text.delete('1.0', 'end')
+        self.transcription_text.insert('1.0', ''.join(
+            self.format_log_entry(created, text, prefix) for created, text in entries
+        ))
 
-            audio_file = f"test{i}.wav"
-            try:
-                transcript = asyncio.run(self.transcribe_audio(audio_file))
+    def search_history(self, event=None):
+        if not self.history:
+            return
+        query = self.search_entry.get().strip()
+        limit = self.settings.get('log_view_entries')
+        if not query:
+            self.show_log_entries(self.history.recent(limit))
+            self.set_status("Ready to record...")
+            return
+        entries = self.history.search(query, limit)
+        self.show_log_entries(entries)
+        self.set_status(f"{len(entries)} transcripts match \"{query}\"")
 
-                # Update GUI
-                self.transcription_text.insert('1.0', f"{datetime.now().strftime('%H:%M:%S')}: {transcript}\n\n")
-                self.status_label.configure(text="Ready to record...")
+    def setup_injector(self):
+        self.injector = TextInjector(self.pykeyboard, self.settings.get('typing_mode'))
 
-                # Log transcription
-                with codecs.open('transcribe.log', 'a', encoding='utf-8') as f:
-                    f.write(f"{datetime.now()}: {transcript}\n")
+    def type_text(self, job, text, cancel_event=None):
+        stats = self.injector.inject(text, cancel_event)
+        if stats.cancelled:
+            status = f"Typing cancelled after {stats.chars} chars"
+        else:
+            status = f"Ready to record... (typed {stats})"
+
+        if job is not None and stats.first_char_at is not None:
+            job.mark('first_char', stats.first_char_at)
+            job.mark('last_char', stats.last_char_at)
+            # Where the wait after the recording went: encoding, queueing, recognition, typing
+            self.last_timings = job.spans()
+            status += "\n" + " | ".join(
+                f"{name} {seconds:.2f}s" for name, seconds in self.last_timings.items()
+                if not name.startswith(('pressed', 'first_audio'))
+            )
+        if job is not None:
+            self.metrics.record(job)
+            self.ui.post('metrics', self.show_metrics)
+        self.set_status(status)
+        return stats
+
+    def show_metrics(self):
+        self.metrics_label.configure(text=self.metrics.summary_text())
 
-                # Type the text
-                for element in transcript:
-                    try:
-                        self.pykeyboard.type(element)
-                        time.sleep(0.0025)
-                    except:
-                        print("empty or unknown symbol")
+    def export_metrics(self):
+        try:
+            paths = self.metrics.export()
+        except OSError as e:
+            self.show_error(f"Can't export metrics: {str(e)}")
+            return
+        self.set_status(f"Metrics saved to {' and '.join(paths)}")
 
-                os.remove(audio_file)
-                i += 1
+    def cancel_typing(self):
+        if self.output:
+            self.output.cancel()
 
-            except Exception as e:
-                self.status_label.configure(text=f"Error: {str(e)}")
-                i += 1
+    def start_transcription_thread(self):
+        from pipeline import JobQueue, JobSpool, OutputStage, TranscriptionPool
+
+        # Typing is its own stage, so it overlaps with transcription of the next clip
+        self.output = OutputStage(self.type_text)
+        self.output.start()
+
+        self.jobs = JobQueue(self.settings.get('max_pending_jobs'))
+        # Several uploads run at once on a long-lived loop, results still come back in order
+        self.transcription_pool = TranscriptionPool(
+            self.jobs,
+            self.transcribe_job,
+            self.transcribe_speech,
+            self.settings.get('max_concurrent_uploads')
+        )
+        self.transcription_pool.start()
+        if hasattr(self, 'profiles'):
+            self.connect_profiles()
+
+        # Dictations that failed or were still pending last time
+        self.spool = JobSpool(self.settings.get('spool_dir'))
+        for job in self.spool.load():
+            self.jobs.put(job)
+
+    async def transcribe_job(self, job):
+        return await self.transcribe_audio(job.audio, job.mimetype, job.profile)
+
+    def transcribe_speech(self, job, transcript, error):
+        if error is not None:
+            from recognizers import RecognizerError
+
+            self.metrics.record_error()
+            # A deadline raises asyncio.TimeoutError, which has no message
+            reason = str(error) or type(error).__name__
+            if isinstance(error, RecognizerError) and not error.retryable:
+                # Rejected by the server, sending it again on every start would fail the same way
+                self.spool.remove(job)
+                self.set_status(f"Error: {reason}")
+                return
+            # Keep the audio so the dictation can be recovered on the next start
+            try:
+                self.spool.save(job)
+                self.set_status(f"Error: {reason} (saved for retry)")
+            except OSError:
+                self.set_status(f"Error: {reason}")
+            return
+        self.spool.remove(job)
+        transcript = self.postprocess(transcript)
+
+        # Log transcription, before it is posted (see refill_log)
+        self.log_transcript(transcript)
+
+        # Update GUI
+        self.ui.post(None, self.add_log_entry, transcript, "recovered " if job.recovered else "", time.time())
+
+        # Recovered dictations only go to the log, the cursor may be anywhere by now
+        if not job.recovered:
+            self.output.submit(job, transcript)
+
+    async def close_recognizer(self):
+        for profile in getattr(self, 'profiles', {}).values():
+            await profile.recognizer.close()
 
     def __del__(self):
         # Clean up hotkey listener
-        if hasattr(self, 'hotkey_listener'):
+        if getattr(self, 'hotkey_listener', None):
             self.hotkey_listener.stop()
 
     def toggle_log_section(self):
@@ -555,62 +1403,132 @@ class VoiceTyperApp:
 
     def clear_logs(self):
         self.transcription_text.delete('1.0', 'end')
-        # Also clear the log file
-        with open('transcribe.log', 'w', encoding='utf-8') as f:
-            f.write('')
+        # Also clear the log file and the search index
+        if self.history:
+            self.history.clear()
+
+    def close_window(self):
+        if self.settings.get('close_to_tray') and self.tray_menu is not None:
+            self.minimize_to_tray()
+        else:
+            self.quit_app()
 
     def minimize_to_tray(self):
-        self.root.withdraw()  # Hide the window
-        if not self.tray_icon.visible:
-            # Start system tray icon in a separate thread
-            threading.Thread(target=self.tray_icon.run, daemon=True).start()
+        """Hides the window, until it is shown again only the hotkey and the capture keep running."""
+        self.root.withdraw()  # The recording animation stops by itself
+        # No polling while hidden, updates wait in the queue and coalesce
+        self.ui.stop()
+        # Edits of settings.json made meanwhile are picked up when the watcher starts again
+        self.settings.stop()
+        if self.history and self.ui_initialized:
+            # Refilled from the history when the window comes back
+            self.transcription_text.delete('1.0', 'end')
+            self.log_stale = True
+        trim_memory()
+        if self.tray_icon is None:
+            self.show_tray_icon()
 
     def show_window(self):
-        self.tray_icon.stop()
-        self.root.after(0, self.root.deiconify)
+        # Runs on the tray's thread. The main loop is idle with no timers, Tk
+        # built with thread support (the default) hands it this call
+        self.root.after(0, self.restore_window)
+
+    def restore_window(self):
+        if self.tray_icon is not None:
+            self.tray_icon.stop()
+            self.tray_icon = None
+        if not self.ui_initialized:
+            # Started in the tray, the window is built on first use
+            self.setup_ui()
+        elif self.log_stale:
+            self.refill_log()
+        self.log_stale = False
+        self.root.deiconify()
+        # Draws what was posted while hidden
+        self.ui.start()
+        self.on_recording_changed()
+        self.settings.watch()
 
     def quit_app(self):
         # Stop background threads
-        self.running = False
+        with self.startup_lock:
+            self.running = False
+            loaded = self.components_ready.is_set()
+        self.ui.stop()
+        if loaded:
+            self.stop_components()
+        # Otherwise load_components stops them once it is done
 
         # Stop hotkey listener
         if hasattr(self, 'hotkey_listener') and self.hotkey_listener:
             self.hotkey_listener.stop()
-
-        # Stop system tray icon
-        if hasattr(self, 'tray_icon') and self.tray_icon.visible:
-            self.tray_icon.stop()
+        self.settings.stop()
 
         # Close main window
         self.root.quit()
         self.root.destroy()  # Explicitly destroy the window
 
+    def stop_components(self):
+        """Stops what load_components started."""
+        if self.jobs is not None:  # An empty JobQueue is falsy
+            # Recordings that were not sent yet are picked up again on the next start
+            for job in self.jobs.close():
+                self.spool.save(job)
+            self.transcription_pool.stop(self.close_recognizer)
+            self.output.stop()
+        if self.capture:
+            self.capture.close()
+        if self.chimes:
+            self.chimes.close()
+        if self.history:
+            self.history.close()
+
+        # Stop system tray icon
+        if self.tray_icon is not None:
+            self.tray_icon.stop()
+
     def open_settings(self):
-        # Pass the update_ui_on_settings_change callback to refresh UI after settings change
-        SettingsDialog(self.root, callback=self.update_ui_on_settings_change)
-        
-    def update_ui_on_settings_change(self):
-        # Reload settings from file
-        with open('settings.json', 'r') as f:
-            self.settings = json.load(f)
-            
-        # Update button text with current shortcut
-        shortcut_key = self.settings.get('shortcut', 'f2')
-        shortcut_display = self.get_shortcut_display(shortcut_key)
-        
-        # Update button text based on recording state
-        if self.is_recording:
-            self.record_button.configure(
-                text=f"■ Stop Recording ({shortcut_display})"
-            )
-        else:
-            self.record_button.configure(
-                text=f"● Start Recording ({shortcut_display})"
-            )
-            
-        # Update hotkey configuration
-        self.setup_hotkey()
-        
+        if not self.components_ready.is_set():
+            self.set_status("Still starting up, try again in a moment...")
+            return
+        SettingsDialog(self.root, self.settings)
+
+    def on_settings_changed(self, changed):
+        """Applies changed settings in place, from the dialog or an edit of settings.json."""
+        if changed & {'shortcut', 'cancel_shortcut', 'profiles'}:
+            self.setup_hotkey()
+            # Update button text with current shortcut
+            self.ui.post('record_button', self.update_record_button)
+        if 'typing_mode' in changed:
+            self.setup_injector()
+        if not self.components_ready.is_set():
+            return  # load_components reads the new values itself
+        from recognizers import update_retry_settings
+
+        if 'rules_file' in changed:
+            self.setup_rules()
+        if changed & CAPTURE_SETTINGS:
+            self.setup_capture()
+        elif 'pre_roll_ms' in changed:
+            # The microphone stream stays open
+            self.capture.set_pre_roll(self.settings.get('pre_roll_ms'))
+
+        # Retry settings are changed in place, only a different backend, key or model needs a new client
+        applied = changed & RETRY_SETTINGS and all([
+            update_retry_settings(profile.recognizer, dict(self.settings, **profile.overrides))
+            for profile in getattr(self, 'profiles', {}).values()
+        ])
+        if changed & RECOGNIZER_SETTINGS or (changed & RETRY_SETTINGS and not applied):
+            try:
+                self.setup_recognizer()
+            except ApiKeyError:
+                self.ui.post(None, self.show_api_key_error)
+            except Exception as e:
+                self.show_error(f"Error: {str(e)}")
+
+        if changed & RESTART_SETTINGS:
+            self.set_status(f"Restart to apply {', '.join(sorted(changed & RESTART_SETTINGS))}")
+
     def get_shortcut_display(self, shortcut_key):
         # Get prettier display format for shortcuts
         shortcuts_display = {
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Span of the whole wait after the hotkey is released, see Job.latency()
+LATENCY = 'stopped->first_char'
+
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, None for no values."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class MetricsStore:
+    """Rolling window of per-utterance timings.
+
+    Each record holds the stage spans of one Job in seconds, the audio
+    duration and the uploaded bytes. Only the last max_samples records are
+    kept. With a path every record is also appended to a JSONL file, which is
+    loaded back on the next start and trimmed once it grows to twice the
+    window. Totals count everything since the app started.
+    """
+
+    def __init__(self, max_samples=500, path=None):
+        self.max_samples = max_samples
+        self.records = deque(maxlen=max_samples)
+        self.path = path
+        self.lock = threading.Lock()
+        self.file_records = 0
+        self.utterances = 0
+        self.errors = 0
+        self.audio_seconds = 0.0
+        self.audio_bytes = 0
+        self.input_overflows = 0
+        self.dropped_frames = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        continue
+                    self.file_records += 1
+        except FileNotFoundError:
+            pass
+
+    def record(self, job):
+        spans = job.spans()
+        latency = job.latency()
+        if latency is not None:
+            spans[LATENCY] = latency
+        record = {
+            'time': time.time(),
+            'spans': spans,
+            'audio_seconds': job.audio_seconds,
+            'audio_bytes': job.audio_bytes,
+            'profile': job.profile,
+        }
+        with self.lock:
+            self.records.append(record)
+            self.utterances += 1
+            self.audio_seconds += job.audio_seconds or 0.0
+            self.audio_bytes += job.audio_bytes or 0
+            if self.path:
+                self._append(record)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_capture(self, overflows, dropped_frames):
+        """Adds the input overflows and dropped frames of one recording, see CaptureEngine.stats()."""
+        with self.lock:
+            self.input_overflows += overflows
+            self.dropped_frames += dropped_frames
+
+    def record_cache(self, hit):
+        """Counts a transcript cache lookup, see TranscriptCache."""
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def _append(self, record):
+        if self.file_records >= 2 * self.max_samples:
+            # Rewrite the file with the current window instead of letting it grow
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(item) + '\n' for item in self.records)
+            os.replace(temporary, self.path)
+            self.file_records = len(self.records)
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        self.file_records += 1
+
+    def summary(self):
+        """Count, mean and quantiles in seconds of every span in the window."""
+        with self.lock:
+            records = list(self.records)
+            totals = {
+                'utterances': self.utterances,
+                'errors': self.errors,
+                'audio_seconds': self.audio_seconds,
+                'audio_bytes': self.audio_bytes,
+                'input_overflows': self.input_overflows,
+                'dropped_frames': self.dropped_frames,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+            }
+        values = {}
+        latencies = {}
+        for record in records:
+            for name, seconds in record['spans'].items():
+                values.setdefault(name, []).append(seconds)
+            if LATENCY in record['spans']:
+                latencies.setdefault(record.get('profile') or 'default', []).append(record['spans'][LATENCY])
+        spans = {name: self._describe(samples) for name, samples in values.items()}
+        # The latency of every recognition profile on its own
+        profiles = {name: self._describe(samples) for name, samples in latencies.items()}
+        return {'window': len(records), 'totals': totals, 'spans': spans, 'profiles': profiles}
+
+    @staticmethod
+    def _describe(samples):
+        description = {'count': len(samples), 'sum': sum(samples), 'mean': sum(samples) / len(samples)}
+        for quantile in QUANTILES:
+            description[f"p{quantile * 100:g}"] = percentile(samples, quantile)
+        return description
+
+    def summary_text(self):
+        summary = self.summary()
+        latency = summary['spans'].get(LATENCY)
+        if not latency:
+            return ""
+        text = f"latency p50 {latency['p50']:.2f}s / p95 {latency['p95']:.2f}s ({latency['count']} dictations)"
+        if len(summary['profiles']) > 1:
+            text += ', ' + ', '.join(
+                f"{name} p50 {profile['p50']:.2f}s" for name, profile in sorted(summary['profiles'].items())
+            )
+        return text
+
+    def to_json(self):
+        with self.lock:
+            records = list(self.records)
+        return json.dumps({'summary': self.summary(), 'records': records}, indent=2)
+
+    def to_prometheus(self):
+        """The summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = [
+            '# HELP voicetyper_span_seconds Time between pipeline stages of recent dictations.',
+            '# TYPE voicetyper_span_seconds summary',
+        ]
+        for name, span in sorted(summary['spans'].items()):
+            label = f'span="{name}"'
+            for quantile in QUANTILES:
+                lines.append(
+                    f'voicetyper_span_seconds{{{label},quantile="{quantile:g}"}} {span[f"p{quantile * 100:g}"]:.6f}'
+                )
+            lines.append(f'voicetyper_span_seconds_sum{{{label}}} {span["sum"]:.6f}')
+            lines.append(f'voicetyper_span_seconds_count{{{label}}} {span["count"]}')
+
+        lines += [
+            '# HELP voicetyper_profile_latency_seconds Time from stopping to the first typed character by profile.',
+            '# TYPE voicetyper_profile_latency_seconds summary',
+        ]
+        for name, profile in sorted(summary['profiles'].items()):
+            label = f'profile="{name}"'
+            for quantile in QUANTILES:
+                lines.append(f'voicetyper_profile_latency_seconds{{{label},quantile="{quantile:g}"}} '
+                             f'{profile[f"p{quantile * 100:g}"]:.6f}')
+            lines.append(f'voicetyper_profile_latency_seconds_sum{{{label}}} {profile["sum"]:.6f}')
+            lines.append(f'voicetyper_profile_latency_seconds_count{{{label}}} {profile["count"]}')
+
+        totals = summary['totals']
+        for name, help_text, value in (
+            ('utterances', 'Dictations transcribed since start.', totals['utterances']),
+            ('errors', 'Transcriptions that failed since start.', totals['errors']),
+            ('audio_seconds', 'Seconds of speech recorded since start.', totals['audio_seconds']),
+            ('uploaded_bytes', 'Encoded audio bytes uploaded since start.', totals['audio_bytes']),
+            ('input_overflows', 'Input overflows the audio device reported while recording.',
+             totals['input_overflows']),
+            ('dropped_frames', 'Audio frames lost because the capture ring was full.', totals['dropped_frames']),
+            ('cache_hits', 'Dictations answered from the transcript cache.', totals['cache_hits']),
+            ('cache_misses', 'Dictations the transcript cache had no answer for.', totals['cache_misses']),
+        ):
+            lines.append(f'# HELP voicetyper_{name}_total {help_text}')
+            lines.append(f'# TYPE voicetyper_{name}_total counter')
+            lines.append(f'voicetyper_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, directory='.'):
+        """Writes metrics.json and metrics.prom and returns their paths."""
+        paths = (os.path.join(directory, 'metrics.json'), os.path.join(directory, 'metrics.prom'))
+        for path, content in zip(paths, (self.to_json(), self.to_prometheus())):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        return paths
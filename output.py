@@ -0,0 +1,207 @@
+import os
+import re
+import sys
+import time
+
+try:
+    import pyperclip
+except ImportError:  # Clipboard mode is optional
+    pyperclip = None
+
+TYPING_MODES = ('chunked', 'adaptive', 'clipboard', 'chars')
+
+# Whole words together with the whitespace that follows them
+WORD_CHUNKS = re.compile(r'\S+\s*|\s+')
+
+
+class InjectionStats:
+    def __init__(self, mode):
+        self.mode = mode
+        self.chars = 0
+        self.keystrokes = 0
+        self.elapsed = 0.0
+        self.skipped = []
+        self.first_char_at = None  # time.perf_counter() after the first chunk was sent
+        self.last_char_at = None
+        self.cancelled = False
+
+    @property
+    def chars_per_second(self):
+        return self.chars / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.chars} chars at {self.chars_per_second:.0f} chars/s ({self.mode})"
+
+
+class TextInjector:
+    """Types text at the cursor position using one of several strategies.
+
+    chunked   - one type() call per word instead of per character
+    adaptive  - like chunked, but slows down only while the target app can't keep up
+    clipboard - pastes the whole text and restores the previous clipboard content
+    chars     - the original per-character typing with a fixed delay
+    """
+
+    def __init__(self, controller, mode='chunked', char_delay=0.0025, max_delay=0.02, backspace_key=None):
+        if mode == 'clipboard' and pyperclip is None:
+            print("pyperclip is not installed, clipboard typing falls back to chunked")
+            mode = 'chunked'
+        if mode not in TYPING_MODES:
+            raise ValueError(f"Unknown typing mode: {mode}")
+        self.controller = controller
+        self.mode = mode
+        self.char_delay = char_delay
+        self.max_delay = max_delay
+        self.delay = 0.0  # Current per-character delay of the adaptive mode
+        self.backspace_key = backspace_key  # pynput's Key.backspace unless given
+
+    def inject(self, text, cancel_event=None):
+        """Types text, stopping early once cancel_event is set."""
+        stats = InjectionStats(self.mode)
+        start = time.perf_counter()
+        if self.mode == 'clipboard':
+            self._paste(text, stats)
+            stats.first_char_at = time.perf_counter()
+        else:
+            chunks = text if self.mode == 'chars' else WORD_CHUNKS.findall(text)
+            for chunk in chunks:
+                if cancel_event is not None and cancel_event.is_set():
+                    stats.cancelled = True
+                    break
+                if self.mode == 'chars':
+                    self._type(chunk, stats)
+                    time.sleep(self.char_delay)
+                else:
+                    self._type_chunk(chunk, stats)
+                if stats.first_char_at is None:
+                    stats.first_char_at = time.perf_counter()
+        stats.last_char_at = time.perf_counter()
+        stats.elapsed = stats.last_char_at - start
+
+        if stats.skipped:
+            print(f"Skipped {len(stats.skipped)} unsupported symbols: {''.join(sorted(set(stats.skipped)))!r}")
+        return stats
+
+    def erase(self, count):
+        """Deletes count characters before the cursor."""
+        if count and self.backspace_key is None:
+            from pynput import keyboard  # Needs a display, only import it when erasing
+            self.backspace_key = keyboard.Key.backspace
+        for _ in range(count):
+            self.controller.tap(self.backspace_key)
+
+    def _type(self, text, stats):
+        # pynput stops at the first character it can't type, skip it and carry on
+        while text:
+            try:
+                self.controller.type(text)
+                stats.chars += len(text)
+                stats.keystrokes += len(text)
+                return
+            except self.controller.InvalidCharacterException as e:
+                index = e.args[0]
+                stats.chars += index
+                stats.keystrokes += index
+                stats.skipped.append(text[index])
+                text = text[index + 1:]
+
+    def _type_chunk(self, chunk, stats):
+        if self.mode != 'adaptive':
+            self._type(chunk, stats)
+            return
+
+        sent = time.perf_counter()
+        self._type(chunk, stats)
+        per_char = (time.perf_counter() - sent) / max(len(chunk), 1)
+        # Key events that take longer to post mean the input queue of the target
+        # is backing up, throttle until it catches up and then speed up again
+        if per_char > self.char_delay:
+            self.delay = min(self.max_delay, max(self.delay * 2, self.char_delay))
+        else:
+            self.delay /= 2
+        if self.delay > 0.0001:
+            time.sleep(self.delay * len(chunk))
+
+    def _paste(self, text, stats):
+        from pynput import keyboard  # Needs a display, only import it when pasting
+
+        previous = pyperclip.paste()
+        pyperclip.copy(text)
+        modifier = keyboard.Key.cmd if sys.platform == 'darwin' else keyboard.Key.ctrl
+        with self.controller.pressed(modifier):
+            self.controller.tap('v')
+        # Give the target app time to read the clipboard before restoring it
+        time.sleep(0.1)
+        pyperclip.copy(previous)
+        stats.chars += len(text)
+        stats.keystrokes += 2
+
+
+def stable_prefix(text, holdback_words):
+    """text without its last holdback_words words, which interim results revise most often."""
+    if not holdback_words:
+        return text
+    return ''.join(WORD_CHUNKS.findall(text)[:-holdback_words])
+
+
+def agreed_prefix(previous, text):
+    """The leading words two hypotheses agree on."""
+    agreed = []
+    for a, b in zip(WORD_CHUNKS.findall(previous), WORD_CHUNKS.findall(text)):
+        if a != b:
+            break
+        agreed.append(a)
+    return ''.join(agreed)
+
+
+class InterimTyper:
+    """Types the interim results of a streaming segment as they arrive.
+
+    Only words that two interim results in a row agree on are typed (minus
+    the last holdback_words words), so a word heard wrong once or cut off
+    never reaches the screen. When agreed text differs from what is on
+    screen, only the characters after the common prefix are erased and the
+    rest is typed. A final result is typed the same way and commits the
+    segment. Once typing was cancelled the rest of the segment is left
+    alone.
+    """
+
+    def __init__(self, injector, holdback_words=0):
+        self.injector = injector
+        self.holdback_words = holdback_words
+        self.shown = ''  # Text of the current segment that is on screen
+        self.previous = ''  # Last interim result, minus the holdback
+        self.cancelled = False
+        self.keystrokes = 0
+        self.final_chars = 0
+
+    @property
+    def keystrokes_per_char(self):
+        return self.keystrokes / self.final_chars if self.final_chars else 0.0
+
+    def update(self, text, final, cancel_event=None):
+        if final:
+            target = text
+        else:
+            candidate = stable_prefix(text, self.holdback_words)
+            target = agreed_prefix(self.previous, candidate)
+            self.previous = candidate
+        # Less agreement than before is no reason to take text back
+        if self.cancelled or (not final and self.shown.startswith(target)):
+            stats = InjectionStats(self.injector.mode)
+        else:
+            prefix = len(os.path.commonprefix([self.shown, target]))
+            erased = len(self.shown) - prefix
+            self.injector.erase(erased)
+            stats = self.injector.inject(target[prefix:], cancel_event)
+            stats.keystrokes += erased
+            self.keystrokes += stats.keystrokes
+            # Characters pynput couldn't type are not on screen either
+            missing = set(stats.skipped)
+            self.shown = target[:prefix] + ''.join(c for c in target[prefix:] if c not in missing)
+            self.cancelled = stats.cancelled
+        if final:
+            self.final_chars += len(text)
+            self.shown = self.previous = ''
+            self.cancelled = False
+        return stats
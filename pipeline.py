@@ -0,0 +1,300 @@
+import asyncio
+import io
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+
+
+class Job:
+    """One recorded utterance on its way from the microphone to the keyboard."""
+
+    _ids = itertools.count(1)
+
+    # Pipeline stages in the order they happen, timestamps use time.perf_counter()
+    STAGES = ('pressed', 'first_audio', 'stopped', 'encoded', 'sent', 'response', 'first_char', 'last_char')
+
+    def __init__(self, audio, mimetype):
+        self.id = next(Job._ids)
+        self.audio = audio
+        self.mimetype = mimetype
+        self.timings = {}
+        self.audio_seconds = None  # Duration of the recorded speech
+        self.audio_bytes = None  # Size of the encoded upload
+        self.spool_path = None  # Set while the audio is kept in a JobSpool
+        self.recovered = False  # Loaded from the spool after a restart
+        self.profile = None  # Name of the recognition profile, None for the default
+
+    def mark(self, stage, timestamp=None):
+        self.timings[stage] = time.perf_counter() if timestamp is None else timestamp
+
+    def spans(self):
+        """Seconds between consecutive stages that were reached."""
+        reached = [stage for stage in self.STAGES if stage in self.timings]
+        return {
+            f"{start}->{end}": self.timings[end] - self.timings[start]
+            for start, end in zip(reached, reached[1:])
+        }
+
+    def latency(self):
+        """Seconds from the end of the recording to the first typed character, the wait the user notices."""
+        if 'stopped' in self.timings and 'first_char' in self.timings:
+            return self.timings['first_char'] - self.timings['stopped']
+        return None
+
+
+class JobQueue:
+    """Bounded producer/consumer hand-off between recording and transcription.
+
+    put() blocks while the queue is full (back-pressure on the recorder) and
+    get() blocks until a job arrives, so neither side polls. After close()
+    every waiting call returns immediately.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.jobs = deque()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, job, timeout=None):
+        """Adds a job, returns False if the queue was closed or stayed full."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.closed or len(self.jobs) < self.maxsize, timeout):
+                return False
+            if self.closed:
+                return False
+            self.jobs.append(job)
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        """Returns the next job in FIFO order, or None once the queue is closed."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.jobs)
+            if self.closed:
+                return None
+            job = self.jobs.popleft()
+            self.condition.notify_all()
+            return job
+
+    def close(self):
+        """Closes the queue and returns the jobs that were still waiting."""
+        with self.condition:
+            self.closed = True
+            pending = list(self.jobs)
+            self.jobs.clear()
+            self.condition.notify_all()
+            return pending
+
+    def __len__(self):
+        with self.condition:
+            return len(self.jobs)
+
+
+class TranscriptionPool:
+    """Transcribes queued jobs concurrently on one long-lived event loop.
+
+    Up to max_concurrent requests are in flight at once. Results are passed
+    to on_result(job, transcript, error) strictly in capture order. It is
+    called on the loop thread and must not block, typing belongs in an
+    OutputStage.
+    """
+
+    def __init__(self, jobs, transcribe, on_result, max_concurrent=3):
+        self.jobs = jobs
+        self.transcribe = transcribe
+        self.on_result = on_result
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.dispatch_thread = threading.Thread(target=self.dispatch)
+        self.lock = threading.Lock()
+        self.order = deque()  # Ids of submitted jobs in capture order
+        self.finished = {}  # Results waiting for an earlier job to finish
+
+    def start(self):
+        self.loop_thread.start()
+        self.dispatch_thread.start()
+
+    def dispatch(self):
+        while True:
+            # Both waits block: on an empty queue and on all slots being busy
+            job = self.jobs.get()
+            if job is None:
+                break
+            self.slots.acquire()
+            with self.lock:
+                self.order.append(job.id)
+            asyncio.run_coroutine_threadsafe(self.process(job), self.loop)
+
+    async def process(self, job):
+        transcript, error = None, None
+        job.mark('sent')
+        try:
+            transcript = await self.transcribe(job)
+        except Exception as e:
+            error = e
+        finally:
+            self.slots.release()
+            job.mark('response')
+
+        with self.lock:
+            self.finished[job.id] = (job, transcript, error)
+            # Release every result whose predecessors are all done
+            while self.order and self.order[0] in self.finished:
+                self.on_result(*self.finished.pop(self.order.popleft()))
+
+    def call_soon(self, coroutine):
+        """Schedules a coroutine on the pool loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run_coroutine(self, coroutine, timeout=None):
+        """Runs a coroutine on the pool loop from another thread and waits for it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def stop(self, cleanup=None, timeout=5):
+        """Stops the pool after the job queue was closed.
+
+        cleanup is an optional coroutine function run on the loop before it stops,
+        e.g. to close HTTP sessions.
+        """
+        self.dispatch_thread.join(timeout)
+        if cleanup is not None:
+            try:
+                self.run_coroutine(cleanup(), timeout)
+            except Exception:
+                pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout)
+
+
+class OutputStage:
+    """Types transcripts on its own thread so the next clip can be transcribed meanwhile.
+
+    inject(job, text, cancel_event) does the typing; cancel() aborts the
+    injection in progress, queued transcripts are still typed afterwards.
+    post() queues other work for the same thread, in the same order.
+    """
+
+    def __init__(self, inject):
+        self.inject = inject
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = {}  # key: queued entry that later posts with the key replace
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, job, text):
+        self.post(None, self.inject, job, text)
+
+    def post(self, key, callback, *args):
+        """Queues callback(*args, cancel_event).
+
+        While an entry with the same key is still queued, a post with that
+        key only replaces its arguments, so a backlog of interim results
+        costs one update. Entries posted with key=None always run and keep
+        later keyed posts behind them.
+        """
+        with self.lock:
+            entry = self.pending.get(key) if key is not None else None
+            if entry is not None:
+                entry[2] = args
+                return
+            entry = [key, callback, args]
+            if key is None:
+                self.pending.clear()
+            else:
+                self.pending[key] = entry
+            self.queue.put(entry)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            with self.lock:
+                key, callback, args = entry
+                if self.pending.get(key) is entry:
+                    del self.pending[key]
+            self.cancel_event.clear()
+            try:
+                callback(*args, self.cancel_event)
+            except Exception as e:
+                print(f"Typing failed: {str(e)}")
+
+    def stop(self, timeout=5):
+        self.cancel_event.set()
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+
+class JobSpool:
+    """Keeps the audio of jobs on disk until they were transcribed.
+
+    Each job is an audio file plus a small JSON sidecar with its mimetype
+    and profile.
+    Jobs left over when the app quits or crashes are loaded again on the
+    next start.
+    """
+
+    def __init__(self, directory='spool'):
+        self.directory = directory
+
+    def save(self, job):
+        if job.spool_path is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{job.id:06d}")
+        job.audio.seek(0)
+        with open(path + '.audio', 'wb') as f:
+            shutil.copyfileobj(job.audio, f)
+        job.audio.seek(0)
+        # The sidecar is written last, a job without one is incomplete and ignored
+        with open(path + '.json', 'w') as f:
+            json.dump({'mimetype': job.mimetype, 'profile': job.profile}, f)
+        job.spool_path = path
+
+    def remove(self, job):
+        if job.spool_path is None:
+            return
+        for extension in ('.json', '.audio'):
+            try:
+                os.remove(job.spool_path + extension)
+            except FileNotFoundError:
+                pass
+        job.spool_path = None
+
+    def load(self):
+        """Returns the spooled jobs in the order they were recorded."""
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name[:-len('.json')])
+            try:
+                with open(path + '.json') as f:
+                    meta = json.load(f)
+                with open(path + '.audio', 'rb') as f:
+                    audio = io.BytesIO(f.read())
+            except (OSError, ValueError) as e:
+                print(f"Skipping spooled job {path}: {str(e)}")
+                continue
+            job = Job(audio, meta['mimetype'])
+            job.profile = meta.get('profile')
+            job.spool_path = path
+            job.recovered = True
+            jobs.append(job)
+        return jobs
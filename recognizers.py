@@ -0,0 +1,555 @@
+import asyncio
+import hashlib
+import io
+import json
+import random
+import sqlite3
+import threading
+import time
+import wave
+from collections import OrderedDict
+
+DEFAULT_API_URL = "https://api.deepgram.com/v1"
+
+BACKENDS = ('deepgram', 'whisper', 'fake')
+
+# Request options for recorded clips, shared by the app and batch.py
+PRERECORDED_OPTIONS = {
+    'punctuate': True,
+    # 'language': 'en',
+    'detect_language': True,
+    # 'model': 'general',
+    'model': 'nova-3'
+}
+
+DEFAULT_PROFILE = 'default'
+
+# Profile keys that become request options. Any other key of a profile,
+# except 'hotkey', overrides a recognizer setting such as backend or api_url
+PROFILE_OPTIONS = ('model', 'language', 'detect_language', 'punctuate', 'smart_format', 'keywords')
+
+
+class RecognizerError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        # Client errors such as a wrong API key won't go away by retrying
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class Recognizer:
+    """Speech recognition backend.
+
+    transcribe() runs on the transcription pool event loop and must not
+    block it; close() releases connections or models when the app quits.
+    """
+
+    name = None
+    # Backends that stay loaded between utterances report it with a chime
+    needs_warmup = False
+
+    def load(self):
+        """Blocking one-time initialization, called from a background thread."""
+
+    async def transcribe(self, audio, mimetype, options):
+        raise NotImplementedError
+
+    async def connect(self):
+        """Opens connections ahead of the next request, where the backend has any."""
+
+    async def close(self):
+        pass
+
+
+def make_query(options):
+    # Deepgram expects lowercase booleans and repeated keys for lists
+    query = []
+    for key, value in options.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            if item is None or item == '':
+                continue
+            query.append((key, str(item).lower() if isinstance(item, bool) else str(item)))
+    return query
+
+
+class DeepgramRecognizer(Recognizer):
+    """Deepgram prerecorded transcription over a long-lived HTTP session.
+
+    The session (and its keep-alive connections) is created on first use
+    inside the event loop that owns it and reused for every request.
+    """
+
+    name = 'deepgram'
+
+    def __init__(self, api_key, api_url=None, max_connections=8, keepalive_timeout=60):
+        self.api_key = api_key
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip('/')
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.used_at = None  # time.monotonic() of the last response
+
+    def get_session(self):
+        import aiohttp  # Takes a while to import, only the deepgram backend needs it
+
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+            )
+        return self.session
+
+    async def transcribe(self, audio, mimetype, options):
+        session = self.get_session()
+        async with session.post(
+            f"{self.api_url}/listen",
+            params=make_query(options),
+            data=audio,
+            headers={'Authorization': f'Token {self.api_key}', 'Content-Type': mimetype}
+        ) as response:
+            body = await response.json(content_type=None)
+            self.used_at = time.monotonic()
+            if response.status >= 400 or body.get('err_msg'):
+                raise RecognizerError(body.get('err_msg') or f"HTTP {response.status}", response.status)
+            return body['results']['channels'][0]['alternatives'][0]['transcript']
+
+    async def connect(self):
+        # A connection used recently is still in the pool
+        if self.used_at is not None and time.monotonic() - self.used_at < self.keepalive_timeout - 5:
+            return
+        import aiohttp
+
+        # Any answer leaves a connection with finished DNS, TCP and TLS handshakes behind
+        try:
+            async with self.get_session().head(
+                f"{self.api_url}/listen", headers={'Authorization': f'Token {self.api_key}'}
+            ) as response:
+                await response.read()
+            self.used_at = time.monotonic()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            pass
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class WhisperRecognizer(Recognizer):
+    """Offline recognition with a local faster-whisper model on the CPU.
+
+    The model is loaded once and kept warm; requests run one at a time on a
+    worker thread so they don't block the event loop.
+    """
+
+    name = 'whisper'
+    needs_warmup = True
+
+    def __init__(self, model='base', device='cpu', compute_type='int8'):
+        self.model_name = model
+        self.device = device
+        self.compute_type = compute_type
+        self.model = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                from faster_whisper import WhisperModel
+                self.model = WhisperModel(self.model_name, device=self.device, compute_type=self.compute_type)
+
+    def _transcribe(self, audio, mimetype, options):
+        self.load()
+        with self.lock:
+            # faster-whisper decodes and resamples file objects itself
+            segments, _ = self.model.transcribe(
+                audio,
+                language=options.get('language'),
+                initial_prompt=' '.join(options.get('keyterm') or options.get('keywords') or []) or None
+            )
+            return ' '.join(segment.text.strip() for segment in segments)
+
+    async def transcribe(self, audio, mimetype, options):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._transcribe, audio, mimetype, options)
+
+
+class FakeRecognizer(Recognizer):
+    """Returns a canned transcript after a fixed delay, for tests and benchmarks."""
+
+    name = 'fake'
+
+    def __init__(self, transcript='This is a fake transcript.', latency=0.0):
+        self.transcript = transcript
+        self.latency = latency
+        self.calls = 0
+
+    async def transcribe(self, audio, mimetype, options):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.transcript
+
+
+class ResilientRecognizer(Recognizer):
+    """Adds per-request deadlines, retries and hedged requests to a recognizer.
+
+    Every attempt has to finish within timeout seconds, plus a second for
+    every min_upload_rate bytes of audio, so a long dictation has time to
+    upload and be processed. Failed attempts are retried with exponential
+    backoff and jitter. With hedge_after, an attempt that is still running
+    that many seconds after its upload should have finished gets a second
+    identical request and whichever answers first wins; this is limited to
+    clips up to hedge_max_bytes because each request needs its own copy of
+    the audio.
+    """
+
+    def __init__(self, recognizer, timeout=30.0, retries=3, backoff=0.5, max_backoff=8.0,
+                 hedge_after=None, hedge_max_bytes=2 * 1024 * 1024, min_upload_rate=64 * 1024):
+        self.recognizer = recognizer
+        self.name = recognizer.name
+        self.needs_warmup = recognizer.needs_warmup
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.hedge_max_bytes = hedge_max_bytes
+        self.min_upload_rate = min_upload_rate
+        self.attempts = 0
+        self.hedges = 0
+
+    def load(self):
+        self.recognizer.load()
+
+    async def transcribe(self, audio, mimetype, options):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._attempt(audio, mimetype, options)
+            except Exception as e:
+                if attempt == self.retries or (isinstance(e, RecognizerError) and not e.retryable):
+                    raise
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_backoff)
+
+    async def _request(self, audio, mimetype, options, timeout):
+        self.attempts += 1
+        return await asyncio.wait_for(self.recognizer.transcribe(audio, mimetype, options), timeout)
+
+    async def _attempt(self, audio, mimetype, options):
+        audio.seek(0)
+        size = audio.seek(0, io.SEEK_END)
+        audio.seek(0)
+        upload_seconds = size / self.min_upload_rate
+        timeout = self.timeout + upload_seconds
+        if not self.hedge_after or size > self.hedge_max_bytes:
+            return await self._request(audio, mimetype, options, timeout)
+
+        data = audio.read()
+        audio.seek(0)
+        primary = asyncio.ensure_future(self._request(io.BytesIO(data), mimetype, options, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after + upload_seconds)
+        if done:
+            return primary.result()
+
+        # The first request is slow, race it against a second one
+        self.hedges += 1
+        pending = {primary, asyncio.ensure_future(self._request(io.BytesIO(data), mimetype, options, timeout))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def connect(self):
+        await self.recognizer.connect()
+
+    async def close(self):
+        await self.recognizer.close()
+
+
+def decoded_blocks(audio, mimetype, frames=1 << 14):
+    """Yields the sample rate and channels of an encoded clip, then its 16-bit samples.
+
+    WAV is read with the wave module, anything else needs soundfile.
+    """
+    if mimetype == 'audio/wav':
+        with wave.open(audio, 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("expected 16-bit samples")
+            yield repr((wav.getframerate(), wav.getnchannels())).encode('ascii')
+            yield from iter(lambda: wav.readframes(frames), b'')
+    else:
+        import soundfile
+
+        with soundfile.SoundFile(audio) as sound:
+            yield repr((sound.samplerate, sound.channels)).encode('ascii')
+            for block in sound.blocks(frames, dtype='int16'):
+                yield block.tobytes()
+
+
+class TranscriptCache:
+    """Content-addressed transcript cache.
+
+    Keys are a SHA-256 of the decoded samples plus the recognizer (backend,
+    API URL or model) and the request options, so the same audio sent with
+    the same options is only transcribed once, however it was encoded. Recent entries live in an in-memory LRU; with a path they are also
+    kept in an SQLite file that survives restarts.
+    """
+
+    def __init__(self, max_entries=128, path=None, max_disk_entries=10000, on_lookup=None):
+        self.max_entries = max_entries
+        self.on_lookup = on_lookup  # on_lookup(hit) after every get(), e.g. MetricsStore.record_cache
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts (key TEXT PRIMARY KEY, transcript TEXT, used_at REAL)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def key(audio, mimetype, identity, options, chunk_size=1 << 16):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([identity, options], sort_keys=True).encode('utf-8'))
+        # The same samples don't always encode to the same bytes (every Ogg
+        # stream gets a random serial number), so the samples are hashed.
+        # Audio that can't be decoded here is hashed as it is
+        audio.seek(0)
+        try:
+            samples = hashlib.sha256()
+            for block in decoded_blocks(audio, mimetype):
+                samples.update(block)
+            digest.update(b'pcm' + samples.digest())
+        except Exception:
+            audio.seek(0)
+            encoded = hashlib.sha256()
+            for block in iter(lambda: audio.read(chunk_size), b''):
+                encoded.update(block)
+            digest.update(b'encoded' + encoded.digest())
+        # Rewound for the upload
+        audio.seek(0)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            transcript = self.entries.get(key)
+            if transcript is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute("SELECT transcript FROM transcripts WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    transcript = row[0]
+                    self.db.execute("UPDATE transcripts SET used_at = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    self._remember(key, transcript)
+
+            if transcript is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.on_lookup:
+            self.on_lookup(transcript is not None)
+        return transcript
+
+    def put(self, key, transcript):
+        with self.lock:
+            self._remember(key, transcript)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?)", (key, transcript, time.time()))
+                # Drop the least recently used rows beyond the limit
+                self.db.execute(
+                    "DELETE FROM transcripts WHERE key NOT IN "
+                    "(SELECT key FROM transcripts ORDER BY used_at DESC LIMIT ?)",
+                    (self.max_disk_entries,)
+                )
+                self.db.commit()
+
+    def _remember(self, key, transcript):
+        self.entries[key] = transcript
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            disk_entries = self.db.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0] if self.db else 0
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'disk_entries': disk_entries,
+                'max_disk_entries': self.max_disk_entries if self.db else 0,
+            }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class CachingRecognizer(Recognizer):
+    """Wraps a recognizer and answers repeated clips from a TranscriptCache.
+
+    identity tells apart recognizers whose answers differ for the same
+    options, e.g. two API URLs or whisper models sharing a cache file.
+    """
+
+    def __init__(self, recognizer, cache, identity=None):
+        self.recognizer = recognizer
+        self.cache = cache
+        self.identity = identity or recognizer.name
+        self.name = recognizer.name
+        self.needs_warmup = recognizer.needs_warmup
+
+    def load(self):
+        self.recognizer.load()
+
+    async def transcribe(self, audio, mimetype, options):
+        loop = asyncio.get_running_loop()
+        # Hashing a long recording takes a moment, keep it off the event loop
+        key = await loop.run_in_executor(None, self.cache.key, audio, mimetype, self.identity, options)
+        transcript = self.cache.get(key)
+        if transcript is None:
+            transcript = await self.recognizer.transcribe(audio, mimetype, options)
+            self.cache.put(key, transcript)
+        return transcript
+
+    async def connect(self):
+        await self.recognizer.connect()
+
+    async def close(self):
+        await self.recognizer.close()
+        self.cache.close()
+
+
+def update_retry_settings(recognizer, settings):
+    """Applies changed retry settings to a running recognizer, returns whether it took them.
+
+    A recognizer without retries, like whisper, has nothing to apply.
+    """
+    while not isinstance(recognizer, ResilientRecognizer):
+        recognizer = getattr(recognizer, 'recognizer', None)
+        if recognizer is None:
+            return True
+    recognizer.timeout = settings.get('request_timeout', 30.0)
+    recognizer.retries = settings.get('max_retries', 3)
+    recognizer.backoff = settings.get('retry_backoff', 0.5)
+    recognizer.hedge_after = settings.get('hedge_after', 0)
+    return True
+
+
+def recognizer_identity(settings):
+    """What, besides the request options, decides the transcript a backend returns."""
+    backend = settings.get('backend', 'deepgram')
+    if backend == 'deepgram':
+        return [backend, settings.get('api_url') or DEFAULT_API_URL]
+    if backend == 'whisper':
+        return [backend, settings.get('whisper_model', 'base'), settings.get('whisper_compute_type', 'int8')]
+    return [backend, settings.get('fake_transcript', 'This is a fake transcript.')]
+
+
+def create_recognizer(settings, on_cache_lookup=None):
+    """Builds the recognizer selected by the 'backend' setting, with the transcript cache.
+
+    on_cache_lookup(hit) is called for every cache lookup.
+    """
+    backend = settings.get('backend', 'deepgram')
+    if backend == 'deepgram':
+        recognizer = DeepgramRecognizer(settings.get('api_key', ''), settings.get('api_url'))
+    elif backend == 'whisper':
+        recognizer = WhisperRecognizer(
+            settings.get('whisper_model', 'base'),
+            settings.get('whisper_device', 'cpu'),
+            settings.get('whisper_compute_type', 'int8')
+        )
+    elif backend == 'fake':
+        recognizer = FakeRecognizer(settings.get('fake_transcript', 'This is a fake transcript.'),
+                                    settings.get('fake_latency', 0.0))
+    else:
+        raise RecognizerError(f"Unknown recognizer backend: {backend}")
+
+    # A local model can't be interrupted or hedged, only network backends get deadlines
+    if backend != 'whisper':
+        recognizer = ResilientRecognizer(
+            recognizer,
+            timeout=settings.get('request_timeout', 30.0),
+            retries=settings.get('max_retries', 3),
+            backoff=settings.get('retry_backoff', 0.5),
+            hedge_after=settings.get('hedge_after', 0)
+        )
+
+    if settings.get('cache_entries', 128) > 0:
+        cache = TranscriptCache(
+            settings.get('cache_entries', 128),
+            settings.get('cache_file'),
+            settings.get('cache_disk_entries', 10000),
+            on_cache_lookup
+        )
+        recognizer = CachingRecognizer(recognizer, cache, recognizer_identity(settings))
+    return recognizer
+
+
+def profile_options(profile):
+    """Request options of a profile, PRERECORDED_OPTIONS for what it leaves out.
+
+    A profile with a fixed language skips language detection, which costs
+    latency on every request.
+    """
+    options = dict(PRERECORDED_OPTIONS)
+    options.update({key: profile[key] for key in PROFILE_OPTIONS if key in profile})
+    if profile.get('language') and 'detect_language' not in profile:
+        del options['detect_language']
+    keywords = options.pop('keywords', None)
+    if keywords:
+        # Nova-3 takes key terms, older models boosted keywords
+        options['keyterm' if str(options.get('model', '')).startswith('nova-3') else 'keywords'] = list(keywords)
+    return options
+
+
+class Profile:
+    """Named request options with a recognizer of their own."""
+
+    def __init__(self, name, options, recognizer, hotkey=None, overrides=None):
+        self.name = name
+        self.options = options
+        self.recognizer = recognizer
+        self.hotkey = hotkey
+        self.overrides = overrides or {}  # Recognizer settings that differ from the app's
+
+
+def create_profiles(settings, on_cache_lookup=None):
+    """The default profile plus the ones in the 'profiles' setting, by name.
+
+    Every profile gets its own recognizer, built from the settings with the
+    profile's overrides, so its client can connect before the first
+    dictation that uses it. on_cache_lookup is passed to create_recognizer.
+    """
+    configured = dict(settings.get('profiles') or {})
+    configured.setdefault(DEFAULT_PROFILE, {})
+    profiles = {}
+    for name in [DEFAULT_PROFILE] + [name for name in configured if name != DEFAULT_PROFILE]:
+        profile = configured[name]
+        if not isinstance(profile, dict):
+            raise RecognizerError(f"Profile {name} must be an object")
+        overrides = {key: value for key, value in profile.items() if key not in PROFILE_OPTIONS and key != 'hotkey'}
+        recognizer = create_recognizer(dict(settings, **overrides), on_cache_lookup)
+        profiles[name] = Profile(name, profile_options(profile), recognizer, profile.get('hotkey'), overrides)
+    return profiles
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import threading
+import time
+
+# Replacements starting with these glue to the word before them
+ATTACH_LEFT = tuple('.,;:!?)\n')
+WHITESPACE = re.compile(r'\s*')
+
+
+def normalize(phrase):
+    return ' '.join(phrase.lower().split())
+
+
+def trie_pattern(phrases):
+    """One regex matching any of the phrases, factored by common prefixes.
+
+    A flat alternation of thousands of phrases is tried phrase by phrase at
+    every position; the trie form rejects most positions after one or two
+    characters. Whitespace inside a phrase matches any run of whitespace.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = None  # End of a phrase
+
+    def pattern(node):
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + pattern(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # A longer phrase is tried first, greedy
+            return '(?:' + body + ')?'
+        return body
+
+    return pattern(trie)
+
+
+class Rules:
+    """Replacement rules compiled into a single regex.
+
+    rules maps spoken phrases to the text that is typed instead, e.g. voice
+    commands ("new line": "\n"), expansions ("btw": "by the way") or casing
+    fixes ("deepgram": "Deepgram"). Phrases match whole words, ignoring
+    case. A replacement that starts with punctuation or a line break drops
+    the space before it, one that ends with a line break drops the space
+    after it.
+    """
+
+    def __init__(self, rules, trie=True):
+        self.replacements = {}
+        for phrase, replacement in rules.items():
+            if not isinstance(replacement, str):
+                raise ValueError(f"Replacement of {phrase!r} is not a string")
+            if normalize(phrase):
+                self.replacements[normalize(phrase)] = replacement
+        self.regex = None
+        if self.replacements:
+            if trie:
+                body = trie_pattern(self.replacements)
+            else:
+                # Longest first, so "new line" wins over "new"
+                body = '|'.join(r'\s+'.join(map(re.escape, phrase.split()))
+                                for phrase in sorted(self.replacements, key=len, reverse=True))
+            # Only the space before a phrase is part of the match, the space after it
+            # may be the space before the next one
+            self.regex = re.compile(r'(\s*)(?<!\w)(' + body + r')(?!\w)', re.IGNORECASE)
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def apply(self, text):
+        if self.regex is None:
+            return text
+        parts = []
+        position = 0
+        while True:
+            match = self.regex.search(text, position)
+            if match is None:
+                break
+            before, phrase = match.groups()
+            replacement = self.replacements[normalize(phrase)]
+            parts.append(text[position:match.start()])
+            if not replacement.startswith(ATTACH_LEFT):
+                parts.append(before)
+            parts.append(replacement)
+            position = match.end()
+            if replacement.endswith('\n'):
+                position = WHITESPACE.match(text, position).end()
+        parts.append(text[position:])
+        return ''.join(parts)
+
+
+class RulesFile:
+    """Rules loaded from a JSON file, reloaded when the file changes.
+
+    The file holds {"rules": {"phrase": "replacement", ...}}. apply() checks
+    the file at most every check_interval seconds. A changed file is
+    compiled on a background thread, which takes most of a second for ten
+    thousand rules, and swapped in when it is ready; until then the old
+    rules stay in use, so apply() never waits for it. A missing file means
+    no rules, a broken one keeps the rules that were loaded before.
+    """
+
+    def __init__(self, path='rules.json', check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.rules = Rules({})
+        self.signature = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self.loader = None  # Thread compiling a changed file
+        self.reload()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self):
+        """Compiles the file again if it changed, returns whether it did."""
+        self.checked_at = time.monotonic()
+        signature = self._stat()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        if signature is None:
+            self.rules = Rules({})
+            return True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                rules = json.load(f).get('rules', {})
+            self.rules = Rules(rules)
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Can't load rules from {self.path}: {str(e)}")
+            return False
+        return True
+
+    def check(self):
+        """Starts reloading the file in the background if it changed."""
+        with self.lock:
+            self.checked_at = time.monotonic()
+            if self.loader is not None or self._stat() == self.signature:
+                return
+            self.loader = threading.Thread(target=self._load, daemon=True)
+            self.loader.start()
+
+    def _load(self):
+        try:
+            self.reload()
+        finally:
+            with self.lock:
+                self.loader = None
+
+    def apply(self, text):
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            self.check()
+        # The rules in use, a reload replaces the object instead of changing it
+        return self.rules.apply(text)
@@ -0,0 +1,38 @@
+"""Runs the real app in a child process, for the tools that measure main.py as it starts for the user."""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_app_directory(prefix, **settings):
+    """Creates a working directory with the assets and a settings.json for the app.
+
+    The app runs there with the fake recognizer and F2 as the hotkey,
+    settings are added to that. The caller removes the directory.
+    """
+    # A scratch working directory so the run doesn't touch the real settings or logs
+    directory = tempfile.mkdtemp(prefix=prefix)
+    shutil.copytree(os.path.join(ROOT, 'assets'), os.path.join(directory, 'assets'))
+    with open(os.path.join(directory, 'settings.json'), 'w') as f:
+        json.dump(dict({'api_key': '', 'shortcut': 'f2', 'backend': 'fake'}, **settings), f)
+    return directory
+
+
+def run_app_script(script, directory, timeout):
+    """Runs script with python in directory and returns the last line it printed.
+
+    Raises RuntimeError with the last line of the error output if it fails
+    or prints nothing.
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=directory, capture_output=True, text=True, timeout=timeout
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode or not lines:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'app failed')
+    return lines[-1]
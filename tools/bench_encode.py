@@ -0,0 +1,56 @@
+"""Benchmarks the capture -> upload encoding stage on synthetic speech-like audio.
+
+Reports bytes sent and encode time per second of audio for each encoding,
+compared to the raw 44.1 kHz stereo PCM the app used to upload.
+
+    python tools/bench_encode.py --seconds 30
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import AudioEncoder, buffer_size, soundfile  # noqa: E402
+from tools.synthetic import synthetic_speech  # noqa: E402
+
+CHUNK = 1024
+
+
+def run(data, seconds, channels, rate, sample_rate, encoding):
+    encoder = AudioEncoder(channels, rate, sample_rate, encoding)
+    step = CHUNK * channels * 2
+    start = time.perf_counter()
+    for offset in range(0, len(data), step):
+        encoder.write(data[offset:offset + step])
+    size = buffer_size(encoder.close())
+    elapsed = time.perf_counter() - start
+    return size / seconds, elapsed / seconds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--capture-rate', type=int, default=44100)
+    parser.add_argument('--capture-channels', type=int, default=2)
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    args = parser.parse_args()
+
+    data = synthetic_speech(args.seconds, args.capture_rate, args.capture_channels)
+    raw_rate = args.capture_rate * args.capture_channels * 2
+
+    encodings = ['wav'] + (['flac', 'opus'] if soundfile else [])
+    print(f"{'encoding':<10}{'bytes/s':>12}{'vs raw':>10}{'encode ms/s':>14}")
+    print(f"{'raw':<10}{raw_rate:>12.0f}{1:>9.1f}x{0:>14.2f}")
+    for encoding in encodings:
+        bytes_per_second, ms_per_second = run(
+            data, args.seconds, args.capture_channels, args.capture_rate, args.sample_rate, encoding
+        )
+        print(f"{encoding:<10}{bytes_per_second:>12.0f}{raw_rate / bytes_per_second:>9.1f}x{ms_per_second:>14.2f}")
+    if not soundfile:
+        print("soundfile is not installed, flac and opus were skipped")
+
+
+if __name__ == '__main__':
+    main()
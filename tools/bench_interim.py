@@ -0,0 +1,98 @@
+"""Measures how many key events interim typing costs per character of final text.
+
+Plays simulated streaming results into InterimTyper and a fake keyboard:
+every segment grows word by word, the newest word often shows up cut off or
+misheard first, now and then an earlier word is revised for one result, and
+the final result adds punctuation and sometimes corrects an earlier word. Reports keystrokes per final character and how
+much of the final text was already on screen when the final result arrived,
+for several holdback settings. Exits with 1 if the typed text isn't exactly
+the final transcript.
+
+    python tools/bench_interim.py
+    python tools/bench_interim.py --segments 200 --revise-rate 0.2 --holdback 0 1 2 3
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from output import InterimTyper, TextInjector  # noqa: E402
+from tools.fakes import FakeKeyboard  # noqa: E402
+
+WORDS = ("the quick brown fox jumps over lazy dog while seven wizards quietly judge boxing matches "
+         "in a small town near river where people meet every morning to talk about weather news").split()
+
+
+def simulate(segments, words_per_segment, partial_rate, revise_rate, correct_rate, seed):
+    """Yields (transcript, is_final) like a streaming recognizer."""
+    rng = random.Random(seed)
+    for _ in range(segments):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(*words_per_segment))]
+        words[0] = words[0].capitalize()  # Punctuated results are capitalized from the start
+        heard = []
+        for word in words:
+            if rng.random() < partial_rate:
+                # First heard cut off or as a different word
+                guess = word[:max(1, len(word) // 2)] if rng.random() < 0.5 else rng.choice(WORDS)
+                yield ' '.join(heard + [guess]), False
+            if heard and rng.random() < revise_rate:
+                index = rng.randrange(1, len(heard)) if len(heard) > 1 else 0
+                yield ' '.join(heard[:index] + [rng.choice(WORDS)] + heard[index + 1:] + [word]), False
+            heard.append(word)
+            yield ' '.join(heard), False
+        if len(words) > 1 and rng.random() < correct_rate:
+            words[rng.randrange(1, len(words))] = rng.choice(WORDS)
+        yield ' '.join(words) + '.', True
+
+
+def run(results, holdback):
+    keyboard = FakeKeyboard()
+    typer = InterimTyper(TextInjector(keyboard, 'chunked', backspace_key=FakeKeyboard.BACKSPACE), holdback)
+    expected = []
+    shown_before_final = 0
+    for transcript, is_final in results:
+        if is_final:
+            expected.append(transcript + ' ')
+            # Already on screen and kept by the final
+            shown_before_final += len(os.path.commonprefix([typer.shown, transcript]))
+            typer.update(transcript + ' ', True)
+        else:
+            typer.update(transcript, False)
+    return typer, keyboard, ''.join(expected), shown_before_final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=100)
+    parser.add_argument('--words', type=int, nargs=2, default=(4, 15), metavar=('MIN', 'MAX'),
+                        help='words per segment')
+    parser.add_argument('--partial-rate', type=float, default=0.5,
+                        help='chance a word first appears cut off or misheard')
+    parser.add_argument('--revise-rate', type=float, default=0.1,
+                        help='chance an earlier word is revised for one interim result')
+    parser.add_argument('--correct-rate', type=float, default=0.2,
+                        help='chance the final result corrects a word of the interim results')
+    parser.add_argument('--holdback', type=int, nargs='*', default=[0, 1, 2], help='holdback settings to compare')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = list(simulate(args.segments, args.words, args.partial_rate, args.revise_rate,
+                            args.correct_rate, args.seed))
+    interim = sum(1 for _, is_final in results if not is_final)
+    print(f"{args.segments} segments, {interim} interim results")
+
+    failed = False
+    for holdback in args.holdback:
+        typer, keyboard, expected, shown = run(results, holdback)
+        if keyboard.text != expected:
+            failed = True
+            print(f"FAIL: holdback {holdback} typed {keyboard.text[:60]!r}..., expected {expected[:60]!r}...")
+        print(f"holdback {holdback}: {typer.keystrokes_per_char:.3f} keystrokes per char, "
+              f"{shown / typer.final_chars:.0%} of the text on screen before the final result")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Checks that long recordings keep a flat memory footprint.
+
+Feeds hours of synthetic capture through the converter and encoder as fast
+as possible, with the resident buffer limited like in the app, and samples
+the process RSS along the way. Exits with status 1 if RSS grows by more than
+the resident buffer limit plus --slack-mb.
+
+    python tools/bench_long_recording.py --hours 2 --max-buffer-mb 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import AudioEncoder, buffer_size  # noqa: E402
+from tools.synthetic import synthetic_speech  # noqa: E402
+
+CHUNK = 1024
+
+
+def rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=1.0)
+    parser.add_argument('--capture-rate', type=int, default=44100)
+    parser.add_argument('--capture-channels', type=int, default=2)
+    parser.add_argument('--encoding', default='wav')
+    parser.add_argument('--max-buffer-mb', type=float, default=32)
+    parser.add_argument('--slack-mb', type=float, default=16, help='allowed growth beyond the resident buffer')
+    parser.add_argument('--report-minutes', type=float, default=15)
+    args = parser.parse_args()
+
+    # A few seconds of audio replayed in a loop, so the input doesn't use memory itself
+    step = CHUNK * args.capture_channels * 2
+    source = synthetic_speech(10, args.capture_rate, args.capture_channels)
+    chunks = [source[offset:offset + step] for offset in range(0, len(source) - step + 1, step)]
+    chunk_seconds = CHUNK / args.capture_rate
+
+    encoder = AudioEncoder(args.capture_channels, args.capture_rate, encoding=args.encoding,
+                           max_resident_bytes=int(args.max_buffer_mb * 1024 * 1024))
+    total_chunks = int(args.hours * 3600 / chunk_seconds)
+    report_every = int(args.report_minutes * 60 / chunk_seconds)
+
+    baseline = rss_mb()
+    peak = baseline
+    start = time.perf_counter()
+    print(f"{'audio':>8}{'RSS MB':>10}{'encoded MB':>12}")
+    for i in range(total_chunks):
+        encoder.write(chunks[i % len(chunks)])
+        if (i + 1) % report_every == 0:
+            rss = rss_mb()
+            peak = max(peak, rss)
+            minutes = (i + 1) * chunk_seconds / 60
+            print(f"{minutes:>6.0f}min{rss:>10.1f}{buffer_size(encoder.buffer) / 1024 / 1024:>12.1f}")
+    audio = encoder.close()
+    elapsed = time.perf_counter() - start
+
+    growth = peak - baseline
+    limit = args.max_buffer_mb + args.slack_mb
+    print(f"{args.hours:.1f}h of audio encoded in {elapsed:.0f}s, {buffer_size(audio) / 1024 / 1024:.0f} MB output, "
+          f"RSS growth {growth:.1f} MB (limit {limit:.0f} MB)")
+    sys.exit(0 if growth <= limit else 1)
+
+
+if __name__ == '__main__':
+    main()
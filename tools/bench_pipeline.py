@@ -0,0 +1,210 @@
+"""Benchmarks the whole dictation pipeline headless: capture, upload and typing.
+
+Runs the app's own recording path (see tools/headless_app.py) and presses
+the hotkey for every utterance. The microphone is a fake PyAudio stream that
+replays WAV fixtures (synthetic speech by default). Transcription goes to
+the fake recognizer, or with --http to tools/fake_deepgram.py over real
+HTTP, through the same retrying client as in the app. Typing goes to a fake
+keyboard that records what was typed. Every transcript is tagged with the
+number of its recording, and the bench exits with 1 unless each recording
+was typed once, in order and with the right text. Reports throughput and
+latency per stage.
+
+    python tools/bench_pipeline.py --utterances 10 --seconds 3 --speed 4
+    python tools/bench_pipeline.py --wav vad_corpus/*.wav --speed 1 --http --latency 0.2 --concurrency 3
+
+Needs the GUI dependencies installed, not a display.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.fakes import FakeKeyboard, FakePyAudio, load_wav  # noqa: E402
+from tools.headless_app import HeadlessApp  # noqa: E402
+from tools.synthetic import synthetic_speech  # noqa: E402
+
+TAG = re.compile(r'\[(\d+)\] (.*)', re.DOTALL)
+
+
+class TaggedApp(HeadlessApp):
+    """Puts the job number in front of every transcript, so the typed text shows the order."""
+
+    async def transcribe_job(self, job):
+        transcript = await super().transcribe_job(job)
+        return f"[{job.id}] {transcript}"
+
+
+def load_fixtures(paths, rate, channels):
+    """Concatenated PCM of the fixtures, or 10 s of synthetic speech without any."""
+    if not paths:
+        return synthetic_speech(10, rate, channels), rate, channels
+    parts = []
+    for path in paths:
+        data, fixture_rate, fixture_channels = load_wav(path)
+        if parts and (fixture_rate, fixture_channels) != (rate, channels):
+            raise ValueError(f"{path} has a different format than {paths[0]}")
+        rate, channels = fixture_rate, fixture_channels
+        parts.append(data)
+    return b''.join(parts), rate, channels
+
+
+def start_fake_server(transcript, latency, jitter):
+    """Runs tools/fake_deepgram.py on a free local port, returns its API URL."""
+    from aiohttp import web
+    from tools.fake_deepgram import FakeDeepgram
+
+    server_args = argparse.Namespace(
+        transcript=transcript, words_per_segment=4, bytes_per_segment=64000, latency=latency,
+        latency_jitter=jitter, error_rate=0.0, stall_rate=0.0, stall_seconds=0.0,
+        drop_stream_after=0
+    )
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_route('*', '/v1/listen', FakeDeepgram(server_args).listen)
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.SockSite(runner, sock).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+
+
+def check_sequence(typed, utterances, transcript):
+    """Problems with the typed transcripts, an empty list if each utterance is there once and in order."""
+    problems = []
+    if len(typed) != utterances:
+        problems.append(f"typed {len(typed)} transcripts for {utterances} utterances")
+    previous = 0
+    for index, text in enumerate(typed):
+        match = TAG.fullmatch(text)
+        if match is None or match.group(2) != transcript:
+            problems.append(f"transcript {index} is {text!r}")
+            continue
+        # Jobs are numbered as recordings end, a repeated or reordered one isn't above the one before
+        job_id = int(match.group(1))
+        if job_id <= previous:
+            problems.append(f"job {job_id} was typed after job {previous}")
+        previous = job_id
+    return problems
+
+
+def quantiles(span):
+    if not span:
+        return "n/a"
+    return f"p50 {span['p50'] * 1000:.0f} ms, p95 {span['p95'] * 1000:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wav', nargs='*', help='WAV fixtures replayed as the microphone, 16-bit PCM')
+    parser.add_argument('--utterances', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=3.0, help='length of every utterance')
+    parser.add_argument('--gap', type=float, default=0.0, help='seconds between utterances')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 1 is real time')
+    parser.add_argument('--capture-rate', type=int, default=44100, help='rate of the synthetic audio')
+    parser.add_argument('--capture-channels', type=int, default=1, help='channels of the synthetic audio')
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--encoding', default='wav')
+    parser.add_argument('--latency', type=float, default=0.1, help='recognizer latency in seconds')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='extra random latency, --http only')
+    parser.add_argument('--http', action='store_true', help='send audio to a local fake Deepgram server')
+    parser.add_argument('--concurrency', type=int, default=3, help='transcription requests in flight')
+    parser.add_argument('--typing-mode', default='chunked', choices=('chunked', 'adaptive', 'chars'))
+    parser.add_argument('--key-delay', type=float, default=0.0, help='seconds every fake key event takes')
+    parser.add_argument('--transcript', default='The quick brown fox jumps over the lazy dog. ')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed has to be above 0, the hotkey is pressed in real time")
+
+    data, rate, channels = load_fixtures(args.wav, args.capture_rate, args.capture_channels)
+    pyaudio = FakePyAudio(data, rate, channels, speed=args.speed, loop=True)
+    settings = {
+        'capture_rate': rate,
+        'capture_channels': channels,
+        'sample_rate': args.sample_rate,
+        'encoding': args.encoding,
+        'typing_mode': args.typing_mode,
+        'max_concurrent_uploads': args.concurrency,
+        'max_pending_jobs': max(args.utterances, 1),
+        'metrics_samples': max(args.utterances, 1),
+        'cache_entries': 0,  # The looped fixture would hit the cache
+    }
+    if args.http:
+        url = start_fake_server(args.transcript, args.latency, args.latency_jitter)
+        settings.update({'backend': 'deepgram', 'api_key': '0' * 40, 'api_url': url})
+    else:
+        settings.update({'backend': 'fake', 'fake_transcript': args.transcript, 'fake_latency': args.latency})
+
+    keyboard = FakeKeyboard(args.key_delay)
+    app = TaggedApp(settings, pyaudio, keyboard)
+
+    start = time.perf_counter()
+    for i in range(args.utterances):
+        # Like pressing the hotkey twice, the utterance is recorded and sent in the background
+        app.toggle_recording()
+        time.sleep(args.seconds / args.speed)
+        app.toggle_recording()
+        if args.gap and i < args.utterances - 1:
+            time.sleep(args.gap)
+    recording_seconds = time.perf_counter() - start
+    complete = app.wait_typed(args.utterances, timeout=60 + args.utterances * args.latency)
+    elapsed = time.perf_counter() - start
+    capture_stats = app.capture.stats()
+    app.close()
+
+    summary = app.metrics.summary()
+    spans, totals = summary['spans'], summary['totals']
+    audio_seconds = totals['audio_seconds'] or float('nan')
+    upload = spans.get('sent->response', {})
+    print(f"{args.utterances} utterances of {args.seconds:g}s in {elapsed:.2f}s "
+          f"({'http' if args.http else 'in-process'} recognizer, {args.encoding}, {args.typing_mode} typing)")
+    print(f"capture  {totals['audio_seconds']:.1f}s of audio in {recording_seconds:.2f}s "
+          f"({audio_seconds / recording_seconds:.1f}x real time), "
+          f"encode tail {quantiles(spans.get('stopped->encoded'))}, "
+          f"hotkey to first audio {quantiles(spans.get('pressed->first_audio'))}, "
+          f"{capture_stats['overflows']} overflows, {capture_stats['dropped_frames']} frames dropped")
+    print(f"upload   {totals['audio_bytes'] / 1024:.0f} KiB, {totals['audio_bytes'] / audio_seconds / 1024:.1f} KiB "
+          f"per audio second, request {quantiles(upload)}, queued {quantiles(spans.get('encoded->sent'))}")
+    typing = {'chars': len(keyboard.text), 'keystrokes': keyboard.keystrokes}
+    print(f"typing   {typing['chars']} chars, "
+          f"first char {quantiles(spans.get('response->first_char'))}, "
+          f"whole text {quantiles(spans.get('first_char->last_char'))}")
+    print(f"latency  stop to first char {quantiles(spans.get('stopped->first_char'))}")
+
+    failures = []
+    if totals['errors']:
+        failures.append(f"{totals['errors']} transcriptions failed")
+    if not complete:
+        failures.append("timed out waiting for the transcripts")
+    failures += check_sequence(app.typed, args.utterances, args.transcript)
+    if keyboard.text != ''.join(app.typed):
+        failures.append("the keyboard got different text than was typed")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'args': vars(args),
+                'elapsed': elapsed,
+                'recording_seconds': recording_seconds,
+                'typing': typing,
+                'capture': capture_stats,
+                'metrics': summary,
+            }, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Measures how long replacement rules take per utterance as the rule set grows.
+
+Generates rule sets of made-up phrases (one to three words, some sharing
+their first words) and utterances in which a few of the phrases occur, then
+times compiling the rules and applying them. Compares the trie-factored
+regex the app uses with a flat alternation of all phrases, and optionally
+with one re.sub per rule. Exits with 1 if the variants don't produce the
+same text, or if either gets the EXAMPLES wrong.
+
+    python tools/bench_rules.py
+    python tools/bench_rules.py --sizes 10 100 1000 10000 --utterances 500 --loop
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import Rules  # noqa: E402
+
+SYLLABLES = "ka lo mi ne tu sa ri po de va zu ki me ra no ti be lu fa go".split()
+FILLER = ("the quick brown fox jumps over lazy dog while seven wizards quietly judge boxing matches "
+          "in a small town near river where people meet every morning to talk about weather news").split()
+# The README rules and what they make of phrases that follow each other
+EXAMPLE_RULES = {"new line": "\n", "new paragraph": "\n\n", "period": ".", "comma": ",",
+                 "btw": "by the way", "deepgram": "Deepgram"}
+EXAMPLES = {
+    "Hello comma btw I use deepgram period": "Hello, by the way I use Deepgram.",
+    "hello period new line world": "hello.\nworld",
+    "one new paragraph two comma three": "one\n\ntwo, three",
+}
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_rules(size, rng):
+    rules = {}
+    stems = [word(rng) for _ in range(max(1, size // 10))]
+    while len(rules) < size:
+        # Shared first words make the phrases overlap like "new line" and "new paragraph"
+        words = [rng.choice(stems)] + [word(rng) for _ in range(rng.randint(0, 2))]
+        rules[' '.join(words)] = rng.choice(['.', ',', '\n', word(rng).capitalize(), ' '.join(words).upper()])
+    return rules
+
+
+def make_utterances(rules, count, rng, words=30, hits=3):
+    phrases = list(rules)
+    utterances = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER) for _ in range(words)]
+        for _ in range(hits):
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(phrases))
+        utterances.append(' '.join(parts))
+    return utterances
+
+
+def loop_apply(compiled, text):
+    """One re.sub per rule, what a naive implementation does."""
+    for regex, replacement in compiled:
+        text = regex.sub(replacement, text)
+    return text
+
+
+def timed(apply, utterances):
+    start = time.perf_counter()
+    results = [apply(text) for text in utterances]
+    return (time.perf_counter() - start) / len(utterances), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10, 100, 1000, 10000], help='rules per set')
+    parser.add_argument('--utterances', type=int, default=200)
+    parser.add_argument('--words', type=int, default=30, help='filler words per utterance')
+    parser.add_argument('--loop', action='store_true', help='also time one re.sub per rule')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    for trie in (True, False):
+        rules = Rules(EXAMPLE_RULES, trie=trie)
+        for text, expected in EXAMPLES.items():
+            if rules.apply(text) != expected:
+                print(f"FAIL: {'trie' if trie else 'flat'} regex made {rules.apply(text)!r} of {text!r}, "
+                      f"not {expected!r}")
+                failed = True
+    print(f"{'rules':>6} {'compile':>10} {'trie':>10} {'flat':>10}" + (f" {'loop':>10}" if args.loop else ''))
+    for size in args.sizes:
+        rules = make_rules(size, rng)
+        utterances = make_utterances(rules, args.utterances, rng, args.words)
+
+        start = time.perf_counter()
+        trie = Rules(rules)
+        compile_time = time.perf_counter() - start
+        flat = Rules(rules, trie=False)
+
+        trie_time, expected = timed(trie.apply, utterances)
+        flat_time, results = timed(flat.apply, utterances)
+        failed |= results != expected
+        line = f"{size:>6} {compile_time * 1e3:>8.1f}ms {trie_time * 1e6:>8.1f}us {flat_time * 1e6:>8.1f}us"
+        if args.loop:
+            # Longest first like the combined regex, but every rule scans the whole text
+            compiled = [(re.compile(r'(?<!\w)' + r'\s+'.join(map(re.escape, phrase.split())) + r'(?!\w)',
+                                    re.IGNORECASE), replacement.replace('\\', r'\\'))
+                        for phrase, replacement in sorted(rules.items(), key=lambda rule: -len(rule[0]))]
+            loop_time, _ = timed(lambda text: loop_apply(compiled, text), utterances)
+            line += f" {loop_time * 1e6:>8.1f}us"
+        print(line)
+
+    if failed:
+        print("FAIL: trie and flat regex produced different text")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
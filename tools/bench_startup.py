@@ -0,0 +1,132 @@
+"""Measures how long main.py takes to start and guards against slow imports creeping back.
+
+Prints the slowest imports of `import main` from `python -X importtime`, then
+starts the app a few times with the fake recognizer and reports when the
+window, the hotkey and the rest of the app were ready. Exits with 1 if
+`import main` fails, one of the heavy modules is imported before the window
+is shown or a limit is exceeded.
+
+    python tools/bench_startup.py --runs 5 --max-hotkey-ms 800
+
+The GUI dependencies have to be installed. The second part also needs a
+display, it is skipped when the app can't start.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.app_process import ROOT, make_app_directory, run_app_script  # noqa: E402
+
+# Loaded on a background thread after the window is up, never by `import main`
+HEAVY_MODULES = ('numpy', 'pyaudio', 'aiohttp', 'deepgram', 'pystray')
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Starts the app, waits until everything has loaded and prints the timings
+APP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+imported = time.perf_counter()
+app = main.VoiceTyperApp()
+
+def poll():
+    if not app.components_ready.is_set():
+        app.root.after(5, poll)
+        return
+    timings = {{'import': imported}}
+    timings.update(app.startup_timings)
+    print(json.dumps({{name: (value - start) * 1000 for name, value in timings.items()}}))
+    app.quit_app()
+
+app.root.after(0, poll)
+app.run()
+'''
+
+
+def import_times():
+    """Returns the cumulative ms of `import main`, its direct imports and every module it loaded."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    # Nested imports are listed before their parent, indented by two spaces per level
+    total, children, loaded = None, [], set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        name, cumulative, depth = match.group(4), int(match.group(2)) / 1000, (len(match.group(3)) - 1) // 2
+        loaded.add(name.split('.')[0])
+        if depth == 1:
+            children.append((name, cumulative))
+        elif depth == 0 and name == 'main':
+            total = cumulative
+        elif depth == 0:
+            children = []  # Interpreter startup, not part of main
+    if total is None:  # The import failed halfway
+        total = sum(ms for _, ms in children)
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return total, children, loaded, error
+
+
+def run_app(directory):
+    return json.loads(run_app_script(APP_SCRIPT.format(root=ROOT), directory, timeout=60))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--max-import-ms', type=float, help='fail if `import main` takes longer')
+    parser.add_argument('--max-hotkey-ms', type=float, help='fail if the hotkey takes longer to become active')
+    args = parser.parse_args()
+    failures = []
+
+    total, children, loaded, error = import_times()
+    print(f"import main: {total:.0f} ms")
+    for name, ms in sorted(children, key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30}{ms:>8.1f} ms")
+    if error:
+        # Nothing below was checked, the modules after the failing one were never imported
+        failures.append(f"import main failed: {error}")
+
+    for name in HEAVY_MODULES:
+        if name in loaded:
+            failures.append(f"{name} is imported at startup")
+    if args.max_import_ms and total > args.max_import_ms:
+        failures.append(f"import main took {total:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+
+    runs = []
+    if not error:
+        directory = make_app_directory('voicetyper-startup-', persistent_capture=False)
+        try:
+            runs = [run_app(directory) for _ in range(args.runs)]
+        except Exception as e:
+            print(f"\nSkipped the startup runs, the app can't start here: {str(e)}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if runs:
+        print(f"\nstartup, median of {len(runs)} runs:")
+        for stage in ('import', 'window', 'hotkey', 'ready'):
+            print(f"  {stage:<10}{statistics.median(run[stage] for run in runs):>8.0f} ms")
+        hotkey = statistics.median(run['hotkey'] for run in runs)
+        if args.max_hotkey_ms and hotkey > args.max_hotkey_ms:
+            failures.append(f"hotkey took {hotkey:.0f} ms (limit {args.max_hotkey_ms:.0f} ms)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
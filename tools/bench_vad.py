@@ -0,0 +1,107 @@
+"""Benchmarks voice activity detection on a corpus of synthetic dictations.
+
+Generates the corpus (WAV files with known speech/pause patterns) if the
+directory does not exist yet, then reports for every file how much audio the
+VAD removed and an estimate of the wait after pressing stop with and without
+VAD. With VAD, segments finished before the stop are already transcribed, so
+only the last segment is still pending.
+
+    python tools/bench_vad.py --corpus vad_corpus
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import PcmConverter, SpeechSegmenter  # noqa: E402
+from tools.synthetic import synthetic_dictation, write_wav  # noqa: E402
+
+CHUNK = 1024
+
+CORPUS = {
+    'short_phrase': [('silence', 1.0), ('speech', 2.0), ('silence', 1.5)],
+    'long_pauses': [('silence', 0.5), ('speech', 3.0), ('silence', 2.0), ('speech', 4.0), ('silence', 3.0),
+                    ('speech', 2.0), ('silence', 1.0)],
+    'continuous': [('silence', 0.3), ('speech', 10.0), ('silence', 0.3)],
+    'hesitant': [('silence', 2.0)] + [('speech', 1.0), ('silence', 1.2)] * 8,
+    'silence_only': [('silence', 5.0)],
+}
+
+
+def make_corpus(directory, rate, channels):
+    for name, pattern in CORPUS.items():
+        write_wav(os.path.join(directory, f"{name}.wav"), synthetic_dictation(pattern, rate, channels), rate, channels)
+
+
+def estimate_wait(segment_seconds, bytes_per_second, uplink_bytes, rtf, rtt):
+    """Upload + recognition time of a segment that is sent after the stop."""
+    return rtt + segment_seconds * bytes_per_second / uplink_bytes + segment_seconds * rtf
+
+
+def run(path, args):
+    with wave.open(path, 'rb') as wf:
+        channels, rate = wf.getnchannels(), wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    duration = len(data) / (2 * channels * rate)
+
+    converter = PcmConverter(channels, rate, args.sample_rate)
+    segmenter = SpeechSegmenter(args.sample_rate, split_ms=args.split_ms)
+    segments, current = [], 0
+    step = CHUNK * channels * 2
+    start = time.perf_counter()
+    events = []
+    for offset in range(0, len(data), step):
+        events.extend(segmenter.process(converter.convert(data[offset:offset + step])))
+    events.extend(segmenter.flush())
+    elapsed = time.perf_counter() - start
+
+    for event, samples in events:
+        if event == 'audio':
+            current += len(samples)
+        elif event == 'end':
+            segments.append(current / args.sample_rate)
+            current = 0
+
+    bytes_per_second = args.sample_rate * 2
+    uplink = args.uplink_kbps * 1000 / 8
+    wait_without = estimate_wait(duration, bytes_per_second, uplink, args.rtf, args.rtt)
+    wait_with = estimate_wait(segments[-1], bytes_per_second, uplink, args.rtf, args.rtt) if segments else 0.0
+    return duration, sum(segments), len(segments), wait_without, wait_with, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default='vad_corpus', help='directory with WAV files, created if missing')
+    parser.add_argument('--capture-rate', type=int, default=44100)
+    parser.add_argument('--capture-channels', type=int, default=1)
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--split-ms', type=int, default=700)
+    parser.add_argument('--uplink-kbps', type=float, default=1000, help='upload bandwidth for the estimate')
+    parser.add_argument('--rtf', type=float, default=0.05, help='recognition seconds per second of audio')
+    parser.add_argument('--rtt', type=float, default=0.3, help='fixed request overhead in seconds')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.corpus):
+        make_corpus(args.corpus, args.capture_rate, args.capture_channels)
+
+    print(f"{'file':<18}{'audio s':>9}{'kept s':>9}{'removed':>9}{'segments':>10}"
+          f"{'wait s':>9}{'VAD wait s':>12}{'VAD ms/s':>10}")
+    totals = np.zeros(5)
+    for path in sorted(glob.glob(os.path.join(args.corpus, '*.wav'))):
+        duration, kept, count, wait_without, wait_with, elapsed = run(path, args)
+        totals += (duration, kept, wait_without, wait_with, elapsed)
+        print(f"{os.path.basename(path)[:17]:<18}{duration:>9.1f}{kept:>9.1f}{1 - kept / duration:>9.0%}{count:>10}"
+              f"{wait_without:>9.2f}{wait_with:>12.2f}{elapsed / duration * 1000:>10.2f}")
+    duration, kept, wait_without, wait_with, elapsed = totals
+    print(f"removed {duration - kept:.1f}s of {duration:.1f}s audio, "
+          f"estimated post-stop latency saved {wait_without - wait_with:.2f}s in total")
+
+
+if __name__ == '__main__':
+    main()
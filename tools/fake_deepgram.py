@@ -0,0 +1,135 @@
+"""Local stand-in for the Deepgram listen API that replays canned results.
+
+Point the app at it by adding "api_url": "http://localhost:8765/v1" to
+settings.json (the API key still has to look valid, e.g. 40 hex digits).
+
+    python tools/fake_deepgram.py --transcript "hello world this is a test"
+
+Prerecorded requests can be made to fail or stall to exercise retries:
+
+    python tools/fake_deepgram.py --error-rate 0.3 --stall-rate 0.1 --stall-seconds 60
+
+and live sessions to drop, to exercise the fallback to a prerecorded request:
+
+    python tools/fake_deepgram.py --drop-stream-after 100000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from aiohttp import WSMsgType, web
+
+
+def results_message(transcript, is_final, start, duration):
+    return {
+        'type': 'Results',
+        'channel_index': [0, 1],
+        'start': start,
+        'duration': duration,
+        'is_final': is_final,
+        'speech_final': is_final,
+        'channel': {'alternatives': [{'transcript': transcript, 'confidence': 0.99, 'words': []}]}
+    }
+
+
+def split_segments(transcript, words_per_segment):
+    words = transcript.split()
+    return [' '.join(words[i:i + words_per_segment]) for i in range(0, len(words), words_per_segment)]
+
+
+class FakeDeepgram:
+    def __init__(self, args):
+        self.args = args
+        self.segments = split_segments(args.transcript, args.words_per_segment)
+
+    async def listen(self, request):
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await self.live(request)
+        return await self.prerecorded(request)
+
+    async def prerecorded(self, request):
+        body = await request.read()
+        await asyncio.sleep(self.args.latency + random.uniform(0, self.args.latency_jitter))
+        if random.random() < self.args.stall_rate:
+            await asyncio.sleep(self.args.stall_seconds)
+        if random.random() < self.args.error_rate:
+            return web.json_response({'err_code': 'INTERNAL', 'err_msg': 'Injected failure'}, status=500)
+        response = {
+            'metadata': {'sha256': hashlib.sha256(body).hexdigest()},
+            'results': {'channels': [{'alternatives': [{'transcript': self.args.transcript, 'confidence': 0.99}]}]}
+        }
+        return web.json_response(response)
+
+    async def live(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        received = 0
+        total = 0
+        pending = list(self.segments)
+        position = 0.0
+
+        async def emit(segment, is_final):
+            await asyncio.sleep(self.args.latency)
+            await ws.send_str(json.dumps(results_message(segment, is_final, position, 1.0)))
+
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                received += len(msg.data)
+                total += len(msg.data)
+                if self.args.drop_stream_after and total >= self.args.drop_stream_after:
+                    # Like a lost connection: no remaining results, no closing metadata
+                    await ws.close(code=1011)
+                    return ws
+                # Every bytes_per_segment of audio produces one interim and one final
+                if pending and received >= self.args.bytes_per_segment:
+                    received = 0
+                    segment = pending.pop(0)
+                    words = segment.split()
+                    await emit(' '.join(words[:max(1, len(words) // 2)]), False)
+                    await emit(segment, True)
+                    position += 1.0
+            elif msg.type == WSMsgType.TEXT:
+                if json.loads(msg.data).get('type') == 'CloseStream':
+                    break
+            else:
+                break
+
+        for segment in pending:
+            await emit(segment, True)
+            position += 1.0
+        # The SDK treats the metadata message (it has a sha256) as the end of the stream
+        await ws.send_str(json.dumps({'type': 'Metadata', 'sha256': '0' * 64, 'duration': position}))
+        await ws.close()
+        return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--transcript', default='This is a canned transcript from the fake server.')
+    parser.add_argument('--words-per-segment', type=int, default=4)
+    parser.add_argument('--bytes-per-segment', type=int, default=64000,
+                        help='audio bytes to receive before replaying the next segment')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds to wait before each response')
+    parser.add_argument('--latency-jitter', type=float, default=0.0,
+                        help='extra random latency of up to this many seconds per prerecorded request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of prerecorded requests answered with HTTP 500')
+    parser.add_argument('--stall-rate', type=float, default=0.0,
+                        help='fraction of prerecorded requests that hang for --stall-seconds')
+    parser.add_argument('--stall-seconds', type=float, default=60.0)
+    parser.add_argument('--drop-stream-after', type=int, default=0,
+                        help='cut live sessions off after this many audio bytes, 0 never')
+    args = parser.parse_args()
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_route('*', '/v1/listen', FakeDeepgram(args).listen)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""Stand-ins for the microphone, the keyboard and the Tk main loop, so the app's stages run headless."""
+import heapq
+import itertools
+import threading
+import time
+import wave
+from contextlib import contextmanager
+
+
+def load_wav(path):
+    """Returns the 16-bit PCM frames, rate and channel count of a WAV file."""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path} is not 16-bit PCM")
+        return wf.readframes(wf.getnframes()), wf.getframerate(), wf.getnchannels()
+
+
+class FakeInputStream:
+    """Replays PCM like a PyAudio input stream.
+
+    Reads are paced at speed times real time, speed=0 returns them as fast as
+    they are asked for. Once the audio ran out the stream returns silence,
+    like a microphone in a quiet room, or starts over with loop=True.
+
+    With a stream_callback a thread plays the device instead and calls it
+    once per buffer. Like a sound card it only holds host_buffers buffers:
+    when the thread runs later than that (the callback was slow, or it
+    didn't get the GIL) the oldest audio is lost, counted in frames_lost,
+    and the next callback gets paInputOverflow.
+    """
+
+    def __init__(self, data, channels, rate, speed=1.0, loop=False, frames_per_buffer=1024, callback=None,
+                 host_buffers=4):
+        self.data = data
+        self.frame_bytes = channels * 2
+        self.rate = rate
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self.frames_read = 0
+        self.frames_lost = 0
+        self.started_at = time.perf_counter()
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.host_buffers = host_buffers
+        self.active = threading.Event()
+        self.thread = None
+        if callback is not None:
+            self.active.set()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _next(self, frames):
+        size = frames * self.frame_bytes
+        if self.loop and self.position >= len(self.data):
+            self.position = 0
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk + bytes(size - len(chunk))
+
+    def read(self, frames, exception_on_overflow=True):
+        chunk = self._next(frames)
+        self.frames_read += frames
+        if self.speed:
+            due = self.started_at + self.frames_read / self.rate / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return chunk
+
+    def _run(self):
+        frames = self.frames_per_buffer
+        status = 0
+        while self.active.is_set():
+            if self.speed:
+                due = self.started_at + (self.frames_read + self.frames_lost + frames) / self.rate / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Buffers the device recorded since, beyond what it can hold, are gone
+                behind = int((time.perf_counter() - due) * self.rate * self.speed / frames)
+                if behind > self.host_buffers:
+                    lost = (behind - self.host_buffers) * frames
+                    self._next(lost)
+                    self.frames_lost += lost
+                    status = FakePyAudio.paInputOverflow
+            else:
+                time.sleep(0)  # Let the consumer run, like a fast device would
+            chunk = self._next(frames)
+            self.frames_read += frames
+            _, flag = self.callback(chunk, frames, {}, status)
+            status = 0
+            if flag != FakePyAudio.paContinue:
+                break
+
+    def write(self, data):
+        pass
+
+    def stop_stream(self):
+        self.active.clear()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def close(self):
+        self.stop_stream()
+
+
+class FakePyAudio:
+    """The part of the PyAudio module the app uses, see CaptureEngine and ChimePlayer.
+
+    Input streams replay data, which has to match the requested rate and
+    channels. Output streams discard what is written.
+    """
+
+    paInt16 = 8
+    paContinue = 0
+    paComplete = 1
+    paInputOverflow = 2
+
+    def __init__(self, data=b'', rate=44100, channels=1, speed=1.0, loop=False):
+        self.data = data
+        self.rate = rate
+        self.channels = channels
+        self.speed = speed
+        self.loop = loop
+        self.opened = 0
+        self.streams = []
+
+    def PyAudio(self):
+        return self
+
+    def open(self, format=None, channels=1, rate=44100, frames_per_buffer=1024, input=False, output=False,
+             stream_callback=None):
+        if input and (channels != self.channels or rate != self.rate):
+            raise ValueError(f"The fixture is {self.channels} channel(s) at {self.rate} Hz, "
+                             f"not {channels} at {rate} Hz")
+        self.opened += 1
+        stream = FakeInputStream(self.data, channels, rate, self.speed, self.loop, frames_per_buffer, stream_callback)
+        self.streams.append(stream)
+        return stream
+
+    def get_format_from_width(self, width):
+        return self.paInt16
+
+    def terminate(self):
+        pass
+
+
+class FakeKeyboard:
+    """Records what a pynput keyboard Controller would have typed.
+
+    key_delay is the time each key event takes to post; characters in
+    unsupported raise InvalidCharacterException like pynput does. Tapping
+    BACKSPACE deletes the last character typed.
+    """
+
+    BACKSPACE = 'backspace'  # Pass as TextInjector(backspace_key=...)
+
+    class InvalidCharacterException(Exception):
+        pass
+
+    def __init__(self, key_delay=0.0, unsupported=''):
+        self.key_delay = key_delay
+        self.unsupported = unsupported
+        self.parts = []
+        self.keystrokes = 0
+        self.lock = threading.Lock()
+
+    def type(self, text):
+        for index, character in enumerate(text):
+            if character in self.unsupported:
+                self._send(text[:index])
+                raise self.InvalidCharacterException(index, character)
+        self._send(text)
+
+    def _send(self, text):
+        if self.key_delay:
+            time.sleep(self.key_delay * len(text))
+        with self.lock:
+            self.parts.append(text)
+            self.keystrokes += len(text)
+
+    @contextmanager
+    def pressed(self, *keys):
+        yield
+
+    def tap(self, key):
+        with self.lock:
+            self.keystrokes += 1
+            if key == self.BACKSPACE:
+                while self.parts and not self.parts[-1]:
+                    self.parts.pop()
+                if self.parts:
+                    self.parts[-1] = self.parts[-1][:-1]
+
+    @property
+    def text(self):
+        with self.lock:
+            return ''.join(self.parts)
+
+
+class FakeTkRoot:
+    """The after() scheduling of a Tk root, with a main loop thread instead of a window.
+
+    Enough to drive a UiQueue; callbacks run on the thread that called
+    mainloop().
+    """
+
+    def __init__(self):
+        self.timers = []
+        self.ids = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+
+    def after(self, ms, callback, *args):
+        with self.condition:
+            heapq.heappush(self.timers, (time.perf_counter() + ms / 1000, next(self.ids), callback, args))
+            self.condition.notify()
+
+    def after_idle(self, callback, *args):
+        self.after(0, callback, *args)
+
+    def mainloop(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.timers or self.timers[0][0] > time.perf_counter()):
+                    self.condition.wait(self.timers[0][0] - time.perf_counter() if self.timers else None)
+                if not self.running:
+                    return
+                _, _, callback, args = heapq.heappop(self.timers)
+            callback(*args)
+
+    def quit(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def destroy(self):
+        self.quit()
@@ -0,0 +1,141 @@
+"""The app's own recording and transcription code, run without a window.
+
+HeadlessApp is VoiceTyperApp minus the window, the hotkey listener, the tray
+and the sounds: the microphone is a FakePyAudio, typing goes to a
+FakeKeyboard and the UI queue runs on a FakeTkRoot. Everything from
+toggle_recording() to the keyboard is the app's code: record_speech, the
+encoder, the JobQueue, TranscriptionPool and OutputStage, transcribe_speech
+and type_text.
+
+The microphone can play a clock (clock_audio) that ClockRecognizer reads
+back, so every transcript tells which stretch of audio it came from.
+
+main.py is imported, so the GUI dependencies have to be installed, a display
+is not needed.
+"""
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+from array import array
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from config import Settings  # noqa: E402
+from metrics import MetricsStore  # noqa: E402
+from recognizers import Recognizer, decoded_blocks  # noqa: E402
+from tools.fakes import FakeKeyboard, FakeTkRoot  # noqa: E402
+from uiqueue import UiQueue  # noqa: E402
+
+
+def clock_audio(seconds, rate=16000, tick_ms=10):
+    """Mono PCM whose samples count tick_ms ticks from 1, silence (0) is never a tick."""
+    ticks = int(seconds * 1000 / tick_ms)
+    if ticks >= 32767:
+        raise ValueError(f"{seconds:g}s of {tick_ms} ms ticks don't fit in 16-bit samples")
+    return (np.arange(int(seconds * rate)) // (rate * tick_ms // 1000) + 1).astype(np.int16).tobytes()
+
+
+class ClockRecognizer(Recognizer):
+    """Transcribes the clock_audio() ticks in a clip as "<first-last> ", "<> " without any.
+
+    Answers after latency plus up to jitter seconds, so a later clip
+    finishes first now and then and the app has to put them back in order.
+    """
+
+    name = 'clock'
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def transcribe(self, audio, mimetype, options):
+        self.calls += 1
+        audio.seek(0)
+        blocks = decoded_blocks(audio, mimetype)
+        next(blocks)  # Rate and channels
+        samples = array('h')
+        for block in blocks:
+            samples.frombytes(block)
+        ticks = [tick for tick in samples if tick > 0]
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        return f"<{min(ticks)}-{max(ticks)}> " if ticks else "<> "
+
+
+class HeadlessApp(main.VoiceTyperApp):
+    """VoiceTyperApp with fakes for the devices and no widgets.
+
+    settings are used as they are, nothing is written to disk except the
+    spool, which goes to a scratch directory. recognizer, if given, replaces
+    the one of every profile. Typed transcripts are collected in typed,
+    status lines in statuses and log entries in log.
+    """
+
+    def __init__(self, settings, pyaudio, keyboard=None, recognizer=None):
+        # VoiceTyperApp.__init__ with fakes instead of the window and the devices
+        self.init_state()
+        self.directory = tempfile.mkdtemp(prefix='voicetyper-headless-')
+        settings = dict({'spool_dir': os.path.join(self.directory, 'spool')}, **settings)
+        self.settings = Settings(os.path.join(self.directory, 'settings.json'), defaults=settings, create=False)
+        self.root = FakeTkRoot()
+        self.ui = UiQueue(self.root, self.settings.get('ui_fps'))
+        self.metrics = MetricsStore(self.settings.get('metrics_samples'))
+        self.pykeyboard = keyboard or FakeKeyboard()
+        self.pyaudio_module = pyaudio
+
+        self.typed = []
+        self.statuses = []
+        self.log = []
+        self.condition = threading.Condition()
+
+        # And load_components minus the hotkey, tray and sounds
+        self.ui.start()
+        threading.Thread(target=self.root.mainloop, daemon=True).start()
+        self.setup_injector()
+        self.setup_capture()
+        self.setup_recognizer()
+        if recognizer is not None:
+            for profile in self.profiles.values():
+                profile.recognizer = recognizer
+            self.recognizer = recognizer
+        self.start_transcription_thread()
+        self.components_ready.set()
+
+    def type_text(self, job, text, cancel_event=None):
+        stats = super().type_text(job, text, cancel_event)
+        with self.condition:
+            self.typed.append(text)
+            self.condition.notify_all()
+        return stats
+
+    def wait_typed(self, count, timeout):
+        """Waits until count transcripts were typed, returns whether they were."""
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.typed) >= count, timeout)
+
+    # The widgets the recording path updates
+
+    def _show_status(self, text, color):
+        self.statuses.append((text, color))
+
+    def add_log_entry(self, text, prefix="", created=None):
+        self.log.append(prefix + text)
+
+    def show_metrics(self):
+        pass
+
+    def update_record_button(self):
+        pass
+
+    def close(self):
+        self.quit_app()
+        shutil.rmtree(self.directory, ignore_errors=True)
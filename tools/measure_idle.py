@@ -0,0 +1,126 @@
+"""Measures what the idle app costs with the window shown and hidden in the tray.
+
+Starts the app with the fake recognizer in a scratch directory, waits until
+it has loaded and let it settle, then samples context switches (every one
+is a thread waking up), CPU time and resident memory over a quiet period.
+It then hides the window to the tray (or shows it, with --start-in-tray)
+and samples again. The numbers include one wakeup of the measuring thread
+per period.
+
+    python tools/measure_idle.py --seconds 10
+    python tools/measure_idle.py --capture --max-tray-wakeups 60
+
+Needs a display and the GUI dependencies. Wakeups are read from /proc on
+Linux and with the optional psutil package elsewhere.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.app_process import ROOT, make_app_directory, run_app_script  # noqa: E402
+
+# Runs in the app's process, prints one JSON line with the results per state
+APP_SCRIPT = '''
+import json, sys, threading, time
+sys.path.insert(0, {root!r})
+import main
+from tools.measure_idle import sample
+
+app = main.VoiceTyperApp()
+
+def measure():
+    app.components_ready.wait()
+    states = ['tray', 'foreground'] if app.start_hidden else ['foreground', 'tray']
+    results = {{}}
+    for state in states:
+        if state != states[0]:
+            # Switched on the main loop, like the window button and the tray menu do
+            app.root.after(0, app.minimize_to_tray if state == 'tray' else app.restore_window)
+        time.sleep({settle})
+        before = sample()
+        time.sleep({seconds})
+        after = sample()
+        results[state] = {{
+            'wakeups': (after['wakeups'] - before['wakeups']) / {seconds},
+            'cpu': (after['cpu'] - before['cpu']) / {seconds},
+            'rss': after['rss'],
+            'threads': after['threads'],
+        }}
+    print(json.dumps(results), flush=True)
+    app.root.after(0, app.quit_app)
+
+threading.Thread(target=measure, daemon=True).start()
+app.run()
+'''
+
+
+def sample():
+    """Context switches of all threads so far, CPU seconds, resident bytes and thread count."""
+    if os.path.isdir('/proc/self/task'):
+        # /proc/self/status only counts the main thread's switches
+        wakeups = 0
+        for task in os.listdir('/proc/self/task'):
+            try:
+                with open(f'/proc/self/task/{task}/status') as f:
+                    for line in f:
+                        if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+                            wakeups += int(line.split()[1])
+            except OSError:
+                continue  # The thread just ended
+        with open('/proc/self/status') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS'))
+    else:
+        try:
+            import psutil
+        except ImportError:
+            raise RuntimeError("measuring needs the psutil package on this platform (pip install psutil)")
+        process = psutil.Process()
+        wakeups = sum(process.num_ctx_switches())
+        rss = process.memory_info().rss
+    return {'wakeups': wakeups, 'cpu': time.process_time(), 'rss': rss, 'threads': threading.active_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help='length of each measurement')
+    parser.add_argument('--settle', type=float, default=2.0, help='seconds to wait before measuring a state')
+    parser.add_argument('--capture', action='store_true',
+                        help='keep the microphone open (persistent_capture), needs an input device')
+    parser.add_argument('--start-in-tray', action='store_true', help='start hidden and show the window second')
+    parser.add_argument('--max-tray-wakeups', type=float, help='fail if the tray state wakes up more often per second')
+    args = parser.parse_args()
+
+    directory = make_app_directory('voicetyper-idle-', persistent_capture=args.capture,
+                                   start_in_tray=args.start_in_tray)
+    try:
+        results = json.loads(run_app_script(
+            APP_SCRIPT.format(root=ROOT, seconds=args.seconds, settle=args.settle),
+            directory, timeout=60 + 2 * (args.seconds + args.settle)
+        ))
+    except Exception as e:
+        print(f"FAIL: the app can't start here: {str(e)}")
+        sys.exit(1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"idle for {args.seconds:g}s, persistent capture {'on' if args.capture else 'off'}")
+    print(f"{'state':<12}{'wakeups/s':>10}{'cpu':>8}{'rss':>10}{'threads':>9}")
+    for state, values in results.items():
+        print(f"{state:<12}{values['wakeups']:>10.1f}{values['cpu']:>8.2%}"
+              f"{values['rss'] / 2 ** 20:>8.1f}MB{values['threads']:>9}")
+
+    tray = results['tray']['wakeups']
+    if args.max_tray_wakeups is not None and tray > args.max_tray_wakeups:
+        print(f"FAIL: {tray:.1f} wakeups per second in the tray (limit {args.max_tray_wakeups:g})")
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
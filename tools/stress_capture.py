@@ -0,0 +1,165 @@
+"""Checks that capture loses no audio while the rest of the app is busy.
+
+A fake device plays a ramp (every sample is the previous one plus one)
+through CaptureEngine in callback mode at real time, while threads type long
+texts into a fake keyboard, flood a UiQueue driven by a fake Tk main loop
+and burn CPU. Recordings are toggled on and off the whole time, and every
+recording is checked for gaps in the ramp. Also reports the device's
+overflows, the frames the ring dropped and how long a toggle took. Exits
+with 1 if any audio was lost.
+
+    python tools/stress_capture.py --seconds 20
+    python tools/stress_capture.py --seconds 10 --typing-threads 2 --key-delay 0 --cpu-threads 4 --ring-ms 200
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import CaptureEngine  # noqa: E402
+from output import TextInjector  # noqa: E402
+from tools.fakes import FakeKeyboard, FakePyAudio, FakeTkRoot  # noqa: E402
+from uiqueue import UiQueue  # noqa: E402
+
+TEXT = "The quick brown fox jumps over the lazy dog, then does it again for good measure. " * 50
+
+
+def ramp(channels):
+    # 65536 frames wrap around exactly like int16, so the looped fixture has no seam
+    samples = np.arange(65536, dtype=np.uint16).astype(np.int16)
+    return np.repeat(samples, channels).tobytes()
+
+
+def count_gaps(data, channels):
+    """Frames missing from a recorded ramp, and the number of places they are missing from."""
+    samples = np.frombuffer(data, dtype=np.int16)[::channels].astype(np.uint16)
+    steps = np.diff(samples) - np.uint16(1)  # 0 where the ramp continues, wraps like the samples
+    gaps = np.flatnonzero(steps)
+    return int(steps[gaps].astype(np.int64).sum()), len(gaps)
+
+
+def typing_load(stop, counter, key_delay):
+    injector = TextInjector(FakeKeyboard(key_delay), 'chunked')
+    while not stop.is_set():
+        counter['chars'] += injector.inject(TEXT).chars
+
+
+def ui_load(stop, ui, counter, rate):
+    labels = {}
+
+    def update(key, value):
+        # Roughly what a widget configure costs in Python
+        labels[key] = ' '.join(str(value * i) for i in range(200))
+        counter['updates'] += 1
+
+    interval = 1 / rate if rate else 0
+    i = 0
+    while not stop.is_set():
+        i += 1
+        ui.post(f"label{i % 8}", update, i % 8, i)
+        ui.post(None, update, 'log', i)
+        if interval:
+            time.sleep(interval)
+
+
+def cpu_load(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(10000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help='how long to run')
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=1024, help='frames per device buffer')
+    parser.add_argument('--ring-ms', type=int, default=2000, help='size of the capture ring')
+    parser.add_argument('--recording', type=float, nargs=2, default=(0.5, 3.0), metavar=('MIN', 'MAX'),
+                        help='length of the recordings in seconds')
+    parser.add_argument('--typing-threads', type=int, default=1)
+    parser.add_argument('--key-delay', type=float, default=0.0005,
+                        help='seconds every fake key event takes, 0 makes typing pure CPU load')
+    parser.add_argument('--ui-threads', type=int, default=2)
+    parser.add_argument('--ui-rate', type=float, default=1000, help='posts per second per UI thread, 0 unlimited')
+    parser.add_argument('--cpu-threads', type=int, default=1, help='threads busy with pure Python work')
+    args = parser.parse_args()
+
+    pyaudio = FakePyAudio(ramp(args.channels), args.rate, args.channels, loop=True)
+    capture = CaptureEngine(args.channels, args.rate, args.chunk, pyaudio_module=pyaudio, ring_ms=args.ring_ms)
+    capture.open()
+
+    root = FakeTkRoot()
+    ui = UiQueue(root, fps=60)
+    ui.start()
+    threading.Thread(target=root.mainloop, daemon=True).start()
+
+    stop = threading.Event()
+    counter = {'chars': 0, 'updates': 0}
+    loads = [threading.Thread(target=typing_load, args=(stop, counter, args.key_delay))
+             for _ in range(args.typing_threads)]
+    loads += [threading.Thread(target=ui_load, args=(stop, ui, counter, args.ui_rate)) for _ in range(args.ui_threads)]
+    loads += [threading.Thread(target=cpu_load, args=(stop,)) for _ in range(args.cpu_threads)]
+    for thread in loads:
+        thread.start()
+
+    results = []
+
+    def record(session):
+        # What record_speech does with the audio, minus the encoding
+        data = b''.join(session)
+        capture.end(session)
+        results.append((len(data) // (2 * args.channels), *count_gaps(data, args.channels)))
+
+    toggles = []
+    recorders = []
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        session = capture.begin()
+        toggles.append(time.perf_counter() - start)
+        recorder = threading.Thread(target=record, args=(session,))
+        recorder.start()
+        recorders.append(recorder)
+        time.sleep(random.uniform(*args.recording))
+        start = time.perf_counter()
+        session.stop()
+        toggles.append(time.perf_counter() - start)
+        time.sleep(random.uniform(0.05, 0.3))
+
+    stop.set()
+    for thread in loads + recorders:
+        thread.join()
+    ui.stop()
+    root.quit()
+    capture.close()
+
+    stats = capture.stats()
+    device_lost = sum(stream.frames_lost for stream in pyaudio.streams)
+    recorded = sum(frames for frames, _, _ in results)
+    missing = sum(missing for _, missing, _ in results)
+    gaps = sum(gaps for _, _, gaps in results)
+    toggles.sort()
+
+    print(f"{len(results)} recordings, {recorded / args.rate:.1f}s of audio in {args.seconds:g}s "
+          f"({args.typing_threads} typing, {args.ui_threads} UI, {args.cpu_threads} CPU threads)")
+    print(f"load     {counter['chars']} chars typed, {counter['updates']} UI updates, "
+          f"{ui.coalesced} coalesced")
+    print(f"device   {stats['frames']} frames, {stats['overflows']} overflows, {device_lost} frames lost")
+    print(f"ring     {stats['dropped_frames']} frames dropped ({args.ring_ms} ms ring)")
+    print(f"toggle   p50 {toggles[len(toggles) // 2] * 1e6:.0f} us, max {toggles[-1] * 1e6:.0f} us")
+    print(f"audio    {missing} frames missing in {gaps} gaps")
+
+    lost = missing or gaps or stats['overflows'] or stats['dropped_frames'] or device_lost
+    if lost:
+        print("FAIL: audio was lost")
+    sys.exit(1 if lost else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Checks that rapid hotkey presses neither drop nor repeat a dictation.
+
+Runs the app headless (see tools/headless_app.py) and calls
+toggle_recording() like the hotkey does, holding every recording only a
+moment and starting the next one right after, while earlier ones are still
+being encoded, uploaded and typed. The fake microphone plays a clock and the
+fake recognizer answers with the clock ticks it heard, after a random
+delay, so the answers come back out of order. Exits with 1 unless every
+recording was typed exactly once and in the order it was made.
+
+    python tools/stress_toggle.py --toggles 50
+    python tools/stress_toggle.py --toggles 200 --hold 0.02 0.1 --gap 0 0 --jitter 0.5 --concurrency 5
+
+Needs the GUI dependencies installed, not a display.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.fakes import FakeKeyboard, FakePyAudio  # noqa: E402
+from tools.headless_app import ClockRecognizer, HeadlessApp, clock_audio  # noqa: E402
+
+RATE = 16000
+CLOCK = re.compile(r'<(?:(\d+)-(\d+))?> ')
+
+
+def check_sequence(typed, recordings):
+    """Problems with the typed transcripts, an empty list if each recording is there once and in order.
+
+    A recording shorter than one device buffer may have no audio at all,
+    its place in the order can't be checked.
+    """
+    problems = []
+    if len(typed) != recordings:
+        problems.append(f"typed {len(typed)} transcripts for {recordings} recordings")
+    previous = None
+    for index, text in enumerate(typed):
+        match = CLOCK.fullmatch(text)
+        if match is None:
+            problems.append(f"transcript {index} is {text!r}")
+            continue
+        if match.group(1) is None:
+            continue
+        first, last = int(match.group(1)), int(match.group(2))
+        # Recordings never share audio, only a tick can be split between two. A repeated
+        # or reordered recording starts before the previous one ended
+        if previous is not None and first < previous[1]:
+            problems.append(f"recording {index} ({first}-{last}) comes after {previous[0]}-{previous[1]}")
+        previous = (first, last)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toggles', type=int, default=50, help='recordings to make')
+    parser.add_argument('--hold', type=float, nargs=2, default=(0.05, 0.2), metavar=('MIN', 'MAX'),
+                        help='seconds every recording is held')
+    parser.add_argument('--gap', type=float, nargs=2, default=(0.0, 0.05), metavar=('MIN', 'MAX'),
+                        help='seconds between a recording and the next one')
+    parser.add_argument('--latency', type=float, default=0.05, help='recognizer latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.5, help='extra random recognizer latency')
+    parser.add_argument('--concurrency', type=int, default=3, help='transcription requests in flight')
+    parser.add_argument('--max-pending', type=int, default=8, help='recordings waiting for transcription')
+    parser.add_argument('--pre-roll-ms', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    seconds = args.toggles * (args.hold[1] + args.gap[1]) + 10
+    pyaudio = FakePyAudio(clock_audio(seconds, RATE), RATE, 1)
+    keyboard = FakeKeyboard()
+    app = HeadlessApp({
+        'backend': 'fake',
+        'capture_rate': RATE,
+        'capture_channels': 1,
+        'sample_rate': RATE,
+        'encoding': 'wav',
+        'pre_roll_ms': args.pre_roll_ms,
+        'max_concurrent_uploads': args.concurrency,
+        'max_pending_jobs': args.max_pending,
+    }, pyaudio, keyboard, ClockRecognizer(args.latency, args.jitter))
+
+    start = time.perf_counter()
+    for _ in range(args.toggles):
+        app.toggle_recording()
+        time.sleep(random.uniform(*args.hold))
+        app.toggle_recording()
+        time.sleep(random.uniform(*args.gap))
+    recorded = time.perf_counter() - start
+    complete = app.wait_typed(args.toggles, timeout=30 + args.toggles * (args.latency + args.jitter))
+    elapsed = time.perf_counter() - start
+    time.sleep(0.5)  # Anything typed twice would show up by now
+    app.close()
+
+    errors = app.metrics.summary()['totals']['errors']
+    empty = app.typed.count("<> ")
+    print(f"{args.toggles} recordings in {recorded:.2f}s, {len(app.typed)} typed after {elapsed:.2f}s "
+          f"({args.concurrency} uploads in flight, {app.recognizer.calls} requests, {errors} errors)")
+    print(f"{empty} recordings were too short to hold any audio")
+
+    failures = check_sequence(app.typed, args.toggles)
+    if not complete:
+        failures.insert(0, "timed out waiting for the transcripts")
+    if len(app.log) != len(app.typed):
+        failures.append(f"{len(app.log)} log entries for {len(app.typed)} typed transcripts")
+    if keyboard.text != ''.join(app.typed):
+        failures.append("the keyboard got different text than was typed")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
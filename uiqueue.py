@@ -0,0 +1,72 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+
+class UiQueue:
+    """Hands widget updates from worker threads to the Tk main loop.
+
+    Tk may only be used from the thread that runs mainloop(). post() can be
+    called from any thread. The main loop drains the queue at most fps times
+    a second while updates arrive and every idle_ms otherwise. Updates
+    posted with the same key coalesce and only the latest one runs, so a
+    burst of status changes costs a single redraw. Updates with key=None
+    always run, in the order they were posted. stop() and start() again
+    pause and resume it, updates posted in between wait and coalesce, so a
+    hidden window costs no wakeups.
+    """
+
+    def __init__(self, root, fps=30, idle_ms=100):
+        self.root = root
+        self.frame_ms = max(1, int(1000 / fps))
+        self.idle_ms = idle_ms
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.thread_id = threading.get_ident()
+        self.running = False
+        self.generation = 0  # Only the newest poll loop keeps running
+        self.coalesced = 0  # Updates that were replaced before they ran
+
+    def post(self, key, callback, *args, **kwargs):
+        with self.lock:
+            if key is None:
+                key = (None, next(self.ids))
+            elif self.pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self.pending[key] = (callback, args, kwargs)
+        # On the main thread there's no need to wait for the next frame
+        if threading.get_ident() == self.thread_id and self.running:
+            self.root.after_idle(self.drain)
+
+    def discard(self, callback):
+        """Drops the pending updates that would call callback."""
+        with self.lock:
+            for key in [key for key, (pending, _, _) in self.pending.items() if pending == callback]:
+                del self.pending[key]
+
+    def start(self):
+        self.running = True
+        self.generation += 1
+        self.root.after(0, self._poll, self.generation)
+
+    def stop(self):
+        self.running = False
+
+    def _poll(self, generation):
+        if not self.running or generation != self.generation:
+            return
+        busy = self.drain()
+        self.root.after(self.frame_ms if busy else self.idle_ms, self._poll, generation)
+
+    def drain(self):
+        """Runs the pending updates, returns whether there were any."""
+        with self.lock:
+            updates = list(self.pending.values())
+            self.pending.clear()
+        for callback, args, kwargs in updates:
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                print(f"UI update failed: {str(e)}")
+        return bool(updates)